@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from Simulator.benchmark import (
+    ENV_PARAMS,
+    compare_results,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+# small sizes of the benchmarks, the full sweep is run by tpf/bench_exp.py
+SEED = 2024
+REPEATS = 3
+AGENT_COUNTS = [10, 30, 100, 300]
+SIZES = {
+    "agent_move": AGENT_COUNTS,
+    "update_omega_matrix": AGENT_COUNTS,
+    "FJ_update_parameters": AGENT_COUNTS,
+    "calculate_hits": AGENT_COUNTS,
+    "update_state_transition_matrix": [10, 100, 1000],
+}
+SIMULATION_PARAMS = {
+    **ENV_PARAMS,
+    "dt": 1,
+    "num_agents": 30,
+    "num_steps": 50,
+    "engine": "vector",
+}
+SIMULATION_SIZES = {"num_agents": [10, 30, 100], "num_steps": [25, 50, 100]}
+
+# timings of a reference commit on the machine the tests run on; the
+# first run without it records it, delete it to record a new one
+BASELINE_PATH = os.path.join(
+    os.path.dirname(__file__), "benchmark_baseline.json"
+)
+
+
+def test_no_regression_against_baseline(tmp_path, monkeypatch):
+    # run_simulation saves its plots under the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("plots/simulation_plots")
+    os.makedirs("plots/task_matrix")
+
+    results_path = str(tmp_path / "results.json")
+    save_results(
+        run_benchmarks(
+            SIZES, SIMULATION_SIZES, SIMULATION_PARAMS, SEED, REPEATS
+        ),
+        results_path,
+    )
+    results = load_results(results_path)
+    assert set(results["benchmarks"]) == set(SIZES) | {
+        f"run_simulation_{parameter}" for parameter in SIMULATION_SIZES
+    }
+
+    if not os.path.exists(BASELINE_PATH):
+        save_results(results, BASELINE_PATH)
+        pytest.skip(f"Benchmark baseline saved at {BASELINE_PATH}")
+    assert compare_results(results, load_results(BASELINE_PATH)) == []
@@ -1,45 +1,69 @@
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
-from interface import AgentData, ContiAgent
+from Env_simulator.boundary import contains_xy
+from interface import (
+    AgentData,
+    ContiAgent,
+    ContiAgentArray,
+    SparseAdjacency,
+)
 from shapely.geometry import Point, Polygon
 
 
 class Agent:
     @classmethod
-    def create(cls, agent_id: int, boundary: Polygon) -> AgentData:
-        position = cls._generate_random_position_within_polygon(boundary)
+    def create(
+        cls,
+        agent_id: int,
+        boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> AgentData:
+        rng = np.random.default_rng(rng)
+        position = cls._generate_random_position_within_polygon(boundary, rng)
         mu = position
         # theta is chosen randomly from 10 to 100
-        theta = np.random.uniform(10, 100)
+        theta = rng.uniform(10, 100)
         return AgentData(agent_id, position, mu, theta, boundary)
 
     @staticmethod
-    def _generate_random_position_within_polygon(boundary: Polygon) -> Point:
+    def _generate_random_position_within_polygon(
+        boundary: Polygon, rng: Optional[np.random.Generator] = None
+    ) -> Point:
+        rng = np.random.default_rng(rng)
         min_x, min_y, max_x, max_y = boundary.bounds
         while True:
-            x = np.random.uniform(min_x, max_x)
-            y = np.random.uniform(min_y, max_y)
+            x = rng.uniform(min_x, max_x)
+            y = rng.uniform(min_y, max_y)
             point = Point(x, y)
             if boundary.contains(point):
                 return point
 
     @staticmethod
-    def move(agent: AgentData, dt: float) -> None:
+    def move(
+        agent: AgentData,
+        dt: float,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        rng = np.random.default_rng(rng)
         agent.theta = max(agent.theta, 0.01)
-        new_x = np.random.normal(agent.mu.x, agent.theta)
-        new_y = np.random.normal(agent.mu.y, agent.theta)
+        new_x = rng.normal(agent.mu.x, agent.theta)
+        new_y = rng.normal(agent.mu.y, agent.theta)
         new_position = Point(new_x, new_y)
 
         if agent.boundary.contains(new_position):
             agent.position = new_position
 
     @staticmethod
-    def update_boundary(agent: AgentData, new_boundary: Polygon) -> None:
+    def update_boundary(
+        agent: AgentData,
+        new_boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
         agent.boundary = new_boundary
         if not new_boundary.contains(agent.position):
             agent.position = Agent._generate_random_position_within_polygon(
-                new_boundary
+                new_boundary, rng
             )
 
     @staticmethod
@@ -49,38 +73,34 @@ class Agent:
         increase_factor=0.01,
         decay_factor=0.01,
     ) -> Tuple[float, np.ndarray]:
-        old_omega_matrix = np.copy(omega_matrix)
-        total_change = 0
-
-        for agent_id in range(omega_matrix.shape[0]):
-            for neighbor_id in range(omega_matrix.shape[1]):
-                if agent_id != neighbor_id:
-                    if agent_id in hits_info:
-                        omega_matrix[agent_id][neighbor_id] += increase_factor
-                    else:
-                        omega_matrix[agent_id][neighbor_id] *= 1 - decay_factor
-                    total_change += abs(
-                        omega_matrix[agent_id][neighbor_id]
-                        - old_omega_matrix[agent_id][neighbor_id]
-                    )
-
-        return total_change, omega_matrix
+        return _Agent.update_omega_matrix(
+            omega_matrix, hits_info, increase_factor, decay_factor
+        )
 
 
 class _Agent:
     @classmethod
-    def create(cls, agent_id: int, boundary: Polygon) -> ContiAgent:
-        position = cls.generate_random_position_within_polygon(boundary)
-        direction = np.random.uniform(0, 2 * np.pi)
-        speed = np.random.uniform(1, 2)
+    def create(
+        cls,
+        agent_id: int,
+        boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> ContiAgent:
+        rng = np.random.default_rng(rng)
+        position = cls.generate_random_position_within_polygon(boundary, rng)
+        direction = rng.uniform(0, 2 * np.pi)
+        speed = rng.uniform(1, 2)
         return ContiAgent(agent_id, position, direction, speed, boundary)
 
     @staticmethod
-    def generate_random_position_within_polygon(boundary: Polygon) -> Point:
+    def generate_random_position_within_polygon(
+        boundary: Polygon, rng: Optional[np.random.Generator] = None
+    ) -> Point:
+        rng = np.random.default_rng(rng)
         min_x, min_y, max_x, max_y = boundary.bounds
         while True:
-            x = np.random.uniform(min_x, max_x)
-            y = np.random.uniform(min_y, max_y)
+            x = rng.uniform(min_x, max_x)
+            y = rng.uniform(min_y, max_y)
             point = Point(x, y)
             if boundary.contains(point):
                 return point
@@ -113,11 +133,15 @@ class _Agent:
         agent.position = new_position
 
     @staticmethod
-    def update_boundary(agent: ContiAgent, new_boundary: Polygon) -> None:
+    def update_boundary(
+        agent: ContiAgent,
+        new_boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
         agent.boundary = new_boundary
         if not new_boundary.contains(agent.position):
             agent.position = _Agent.generate_random_position_within_polygon(
-                new_boundary
+                new_boundary, rng
             )
 
     @staticmethod
@@ -127,19 +151,169 @@ class _Agent:
         increase_factor=0.01,
         decay_factor=0.01,
     ) -> Tuple[float, np.ndarray]:
-        old_omega_matrix = np.copy(omega_matrix)
-        total_change = 0
-
-        for agent_id in range(omega_matrix.shape[0]):
-            for neighbor_id in range(omega_matrix.shape[1]):
-                if agent_id != neighbor_id:
-                    if agent_id in hits_info:
-                        omega_matrix[agent_id][neighbor_id] += increase_factor
-                    else:
-                        omega_matrix[agent_id][neighbor_id] *= 1 - decay_factor
-                    total_change += abs(
-                        omega_matrix[agent_id][neighbor_id]
-                        - old_omega_matrix[agent_id][neighbor_id]
-                    )
-
-        return total_change, omega_matrix
+        """
+        param omega_matrix: matrix of weights, updated in place
+        param hits_info: agents (row indices) that hit the target this step
+
+        Off-diagonal entries of hit rows increase by increase_factor, the
+        others decay by decay_factor. The total absolute change is worked
+        out from the row sums before the update.
+        """
+        n = omega_matrix.shape[0]
+        hit = np.zeros(n, dtype=bool)
+        hit[[agent_id for agent_id in hits_info if 0 <= agent_id < n]] = True
+        total_change = _Agent.update_omega_matrices(
+            omega_matrix, hit, increase_factor, decay_factor
+        )
+        return float(total_change), omega_matrix
+
+    @staticmethod
+    def update_omega_matrices(
+        omega_matrices: np.ndarray,
+        hit: np.ndarray,
+        increase_factor=0.01,
+        decay_factor=0.01,
+    ) -> np.ndarray:
+        """
+        param omega_matrices: (..., n, n) stack of weights, updated in place
+        param hit: (..., n) mask of the rows whose agent hit the target
+
+        Batched form of update_omega_matrix, returns the total change of
+        every matrix in the stack
+        """
+        n = omega_matrices.shape[-1]
+        diagonal = np.diagonal(omega_matrices, axis1=-2, axis2=-1).copy()
+
+        row_sums = np.abs(omega_matrices).sum(axis=-1) - np.abs(diagonal)
+        total_change = decay_factor * np.where(hit, 0, row_sums).sum(
+            axis=-1
+        ) + increase_factor * (n - 1) * np.count_nonzero(hit, axis=-1)
+
+        omega_matrices *= np.where(hit, 1, 1 - decay_factor)[..., np.newaxis]
+        omega_matrices += np.where(hit, increase_factor, 0)[..., np.newaxis]
+        np.einsum("...ii->...i", omega_matrices)[...] = diagonal
+
+        return total_change
+
+    @staticmethod
+    def update_edge_weights(
+        weights: np.ndarray,
+        adjacency: SparseAdjacency,
+        hits_info: dict,
+        increase_factor=0.01,
+        decay_factor=0.01,
+    ) -> Tuple[float, np.ndarray]:
+        """
+        param weights: omega weight of every edge of adjacency, updated in
+        place
+        param hits_info: agents (row indices) that hit the target this step
+
+        update_omega_matrix restricted to the edges of a fixed sparse
+        topology, costs O(edges) instead of O(n^2)
+        """
+        n = adjacency.num_nodes
+        hit = np.zeros(n, dtype=bool)
+        hit[[agent_id for agent_id in hits_info if 0 <= agent_id < n]] = True
+        edge_hit = hit[adjacency.rows]
+        total_change = decay_factor * np.abs(
+            weights[~edge_hit]
+        ).sum() + increase_factor * np.count_nonzero(edge_hit)
+        weights[~edge_hit] *= 1 - decay_factor
+        weights[edge_hit] += increase_factor
+        return float(total_change), weights
+
+
+class _AgentArray:
+    @classmethod
+    def create(
+        cls,
+        num_agents: int,
+        num_groups: int,
+        boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> ContiAgentArray:
+        """
+        param num_agents: number of agents in each group
+        param num_groups: number of groups
+        param boundary: initial boundary
+        param rng: random generator, a fresh one if None
+
+        Agents of group g occupy rows [g * num_agents, (g + 1) * num_agents)
+        """
+        rng = np.random.default_rng(rng)
+        total = num_agents * num_groups
+        position = cls.generate_random_positions_within_polygon(
+            boundary, total, rng
+        )
+        direction = rng.uniform(0, 2 * np.pi, total)
+        speed = rng.uniform(1, 2, total)
+        group = np.repeat(np.arange(num_groups), num_agents)
+        return ContiAgentArray(
+            np.arange(total), group, position, direction, speed, boundary
+        )
+
+    @staticmethod
+    def generate_random_positions_within_polygon(
+        boundary: Polygon, n: int, rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        rng = np.random.default_rng(rng)
+        min_x, min_y, max_x, max_y = boundary.bounds
+        positions = np.empty((n, 2))
+        missing = np.arange(n)
+        while missing.size:
+            x = rng.uniform(min_x, max_x, missing.size)
+            y = rng.uniform(min_y, max_y, missing.size)
+            inside = contains_xy(boundary, x, y)
+            positions[missing[inside], 0] = x[inside]
+            positions[missing[inside], 1] = y[inside]
+            missing = missing[~inside]
+        return positions
+
+    @staticmethod
+    def move(agents: ContiAgentArray, dt: float) -> None:
+        boundary = agents.boundary
+        min_x, min_y, max_x, max_y = boundary.bounds
+        x = (
+            agents.position[:, 0]
+            + agents.speed * np.cos(agents.direction) * dt
+        )
+        y = (
+            agents.position[:, 1]
+            + agents.speed * np.sin(agents.direction) * dt
+        )
+
+        # bounce the agents that left the boundary, same rules as _Agent.move
+        outside = ~contains_xy(boundary, x, y)
+        left = outside & (x < min_x)
+        right = outside & (x > max_x)
+        x[left] = min_x
+        x[right] = max_x
+        hit_x = left | right
+        agents.direction[hit_x] = np.pi - agents.direction[hit_x]
+
+        bottom = outside & (y < min_y)
+        top = outside & (y > max_y)
+        y[bottom] = min_y
+        y[top] = max_y
+        hit_y = bottom | top
+        agents.direction[hit_y] = -agents.direction[hit_y]
+
+        agents.position[:, 0] = x
+        agents.position[:, 1] = y
+
+    @staticmethod
+    def update_boundary(
+        agents: ContiAgentArray,
+        new_boundary: Polygon,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        agents.boundary = new_boundary
+        outside = ~contains_xy(
+            new_boundary, agents.position[:, 0], agents.position[:, 1]
+        )
+        if outside.any():
+            agents.position[outside] = (
+                _AgentArray.generate_random_positions_within_polygon(
+                    new_boundary, int(outside.sum()), rng
+                )
+            )
@@ -0,0 +1,193 @@
+from typing import List, Optional, Sequence, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from interface import GraphData, SparseAdjacency
+
+# a group topology: a graph, its edge list, or a CSR (data, indices,
+# indptr) adjacency as returned by Env.get_state_transition_matrix
+Topology = Union[GraphData, nx.Graph, SparseAdjacency, Tuple[np.ndarray, ...]]
+
+
+class TopologyProvider:
+    """
+    Per-step communication topologies of the dynamic agent groups: one
+    random mesh per link percentage, then a star and a ring. The star and
+    ring never change and are built once; the meshes are resampled on
+    every call to sample() as sparse edge lists.
+    """
+
+    def __init__(
+        self,
+        num_agents: int,
+        link_percentage_list: List[float],
+        rng: Optional[np.random.Generator] = None,
+    ):
+        self.num_agents = num_agents
+        self.link_percentage_list = link_percentage_list
+        self.rng = np.random.default_rng(rng)
+        self.star = self.create_star(num_agents)
+        self.ring = self.create_ring(num_agents)
+        self._tiled = {1: (self.star, self.ring)}
+
+    def sample(self, num_blocks: int = 1) -> List[SparseAdjacency]:
+        """
+        param num_blocks: number of independent copies of every topology,
+        laid out as one block-diagonal adjacency (used by ensembles)
+        """
+        if num_blocks not in self._tiled:
+            self._tiled[num_blocks] = (
+                self.tile(self.star, num_blocks),
+                self.tile(self.ring, num_blocks),
+            )
+        meshes = [
+            self.sample_mesh(
+                self.num_agents, link_percentage, num_blocks, self.rng
+            )
+            for link_percentage in self.link_percentage_list
+        ]
+        return meshes + list(self._tiled[num_blocks])
+
+    @staticmethod
+    def from_linear_index(
+        num_agents: int, index: np.ndarray, num_blocks: int = 1
+    ) -> SparseAdjacency:
+        # index enumerates the entries of num_blocks stacked n x n matrices;
+        # drop self loops and duplicates, as np.fill_diagonal(matrix, 0)
+        index = np.unique(index)
+        block, entry = np.divmod(index, num_agents * num_agents)
+        rows, cols = np.divmod(entry, num_agents)
+        off_diagonal = rows != cols
+        offset = block[off_diagonal] * num_agents
+        return SparseAdjacency(
+            num_agents * num_blocks,
+            offset + rows[off_diagonal],
+            offset + cols[off_diagonal],
+        )
+
+    @staticmethod
+    def tile(adjacency: SparseAdjacency, num_blocks: int) -> SparseAdjacency:
+        offset = np.arange(num_blocks)[:, np.newaxis] * adjacency.num_nodes
+        return SparseAdjacency(
+            adjacency.num_nodes * num_blocks,
+            (offset + adjacency.rows).ravel(),
+            (offset + adjacency.cols).ravel(),
+        )
+
+    @staticmethod
+    def sample_mesh(
+        num_agents: int,
+        link_percentage: float,
+        num_blocks: int = 1,
+        rng: Optional[np.random.Generator] = None,
+    ) -> SparseAdjacency:
+        """
+        Each of the num_agents**2 entries is an edge with probability
+        link_percentage. The gaps between consecutive edges are geometric,
+        so only the sampled edges are drawn instead of N^2 uniforms.
+        """
+        rng = np.random.default_rng(rng)
+        size = num_blocks * num_agents * num_agents
+        if link_percentage <= 0 or size == 0:
+            return TopologyProvider.from_linear_index(
+                num_agents, np.zeros(0, dtype=np.int64), num_blocks
+            )
+        if link_percentage >= 1:
+            return TopologyProvider.from_linear_index(
+                num_agents, np.arange(size), num_blocks
+            )
+
+        # draw a few standard deviations more gaps than the expected number
+        # of edges, and top up in the rare case they do not reach the end
+        expected = size * link_percentage
+        batch = int(expected + 4 * np.sqrt(expected) + 16)
+        chunks = []
+        last = -1
+        while last < size:
+            gaps = rng.geometric(link_percentage, batch)
+            index = last + np.cumsum(gaps)
+            chunks.append(index)
+            last = index[-1]
+        index = np.concatenate(chunks)
+        return TopologyProvider.from_linear_index(
+            num_agents, index[index < size], num_blocks
+        )
+
+    @staticmethod
+    def create_star(num_agents: int) -> SparseAdjacency:
+        leaves = np.arange(1, num_agents)
+        hub = np.zeros_like(leaves)
+        return TopologyProvider.from_linear_index(
+            num_agents,
+            np.concatenate([hub * num_agents + leaves, leaves * num_agents]),
+        )
+
+    @staticmethod
+    def create_ring(num_agents: int) -> SparseAdjacency:
+        nodes = np.arange(num_agents)
+        successors = (nodes + 1) % num_agents
+        return TopologyProvider.from_linear_index(
+            num_agents,
+            np.concatenate(
+                [
+                    nodes * num_agents + successors,
+                    successors * num_agents + nodes,
+                ]
+            ),
+        )
+
+
+def to_adjacency(topology: Topology) -> SparseAdjacency:
+    """
+    Edge list of a group topology; the agents of a graph are its nodes in
+    graph.nodes order, undirected edges link both ways. Self loops and
+    zero CSR entries are dropped.
+    """
+    if isinstance(topology, SparseAdjacency):
+        rows, cols = topology.rows, topology.cols
+        num_nodes = topology.num_nodes
+    elif isinstance(topology, (GraphData, nx.Graph)):
+        graph = topology.graph if isinstance(topology, GraphData) else topology
+        if not graph.is_directed():
+            graph = graph.to_directed()
+        index = {node: i for i, node in enumerate(graph.nodes)}
+        edges = np.array(
+            [(index[u], index[v]) for u, v in graph.edges], dtype=np.int64
+        ).reshape(-1, 2)
+        rows, cols = edges.T
+        num_nodes = len(index)
+    else:
+        data, indices, indptr = (np.asarray(array) for array in topology)
+        num_nodes = len(indptr) - 1
+        rows = np.repeat(np.arange(num_nodes), np.diff(indptr))
+        cols = indices
+        rows, cols = rows[data != 0], cols[data != 0]
+    return TopologyProvider.from_linear_index(
+        num_nodes, np.asarray(rows, np.int64) * num_nodes + cols
+    )
+
+
+class FixedTopologyProvider:
+    """
+    Per-step topologies of dynamic agent groups that never change, one
+    sparse adjacency per group, e.g. the GraphData of
+    Generator.AgentGraphGenerator. Nothing is drawn per step.
+    """
+
+    def __init__(self, topologies: Sequence[Topology]):
+        self.adjacencies = [to_adjacency(topology) for topology in topologies]
+        self._tiled = {1: self.adjacencies}
+
+    @staticmethod
+    def label(topology: Topology, index: int) -> str:
+        if isinstance(topology, GraphData):
+            return topology.name
+        return f"Topology {index}"
+
+    def sample(self, num_blocks: int = 1) -> List[SparseAdjacency]:
+        if num_blocks not in self._tiled:
+            self._tiled[num_blocks] = [
+                TopologyProvider.tile(adjacency, num_blocks)
+                for adjacency in self.adjacencies
+            ]
+        return self._tiled[num_blocks]
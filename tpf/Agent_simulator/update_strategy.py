@@ -1,7 +1,8 @@
-from typing import List
+from typing import List, Optional, Union
 
 import numpy as np
-from interface import AgentData, ContiAgent
+from Env_simulator.boundary import covers_xy
+from interface import AgentData, ContiAgent, ContiAgentArray, SparseAdjacency
 from shapely.geometry import Point
 
 
@@ -13,6 +14,7 @@ class Para_update_strategies:
         omega_matrix: np.ndarray,
         agents: List[ContiAgent],
         temporary_matrix: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
     ) -> None:
         """
         param agent: agent to update
@@ -20,10 +22,12 @@ class Para_update_strategies:
         param omega_matrix: matrix of weights
         param agents: list of agents
         param temporary_matrix: temporary matrix
+        param rng: random generator, a fresh one if None
 
         This function is used to update the Continuous movement of agents
         """
 
+        rng = np.random.default_rng(rng)
         update_weight = 0.9
         beta = 0.9
 
@@ -41,10 +45,10 @@ class Para_update_strategies:
         if len(active_agents) >= 2:
             # 随机选择一个邻居
             neighbors = [i for i in active_agents if i != agent.id]
-            Ji = np.random.choice(neighbors)
+            Ji = rng.choice(neighbors)
 
             # 以概率 β 更新代理的状态
-            if np.random.rand() < beta:
+            if rng.random() < beta:
                 updated_position_x = (
                     update_weight * agents[Ji].position.x
                     + (1 - update_weight) * agent.position.x
@@ -82,6 +86,7 @@ class Para_update_strategies:
         omega_matrix: np.ndarray,
         agents: List[ContiAgent],
         temporary_matrix: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
     ) -> None:
         """
         param agent: agent to update
@@ -89,10 +94,12 @@ class Para_update_strategies:
         param omega_matrix: matrix of weights
         param agents: list of agents
         param temporary_matrix: temporary matrix
+        param rng: random generator, a fresh one if None
 
         This function is used to update the Continuous movement of agents
         """
 
+        rng = np.random.default_rng(rng)
         update_weight = 0.5
         beta = 0.5
 
@@ -126,7 +133,7 @@ class Para_update_strategies:
                     update_position_y += weight * agents[i].position.y
                     update_speed += weight * agents[i].speed
 
-        if np.random.rand() < beta:
+        if rng.random() < beta:
             updated_position = Point(
                 update_weight * update_position_x
                 + (1 - update_weight) * agent.position.x,
@@ -147,6 +154,180 @@ class Para_update_strategies:
                 # print("Agent is out of boundary")
                 agent.position = agent.position
 
+    @staticmethod
+    def FJ_update_group(
+        agents: List[ContiAgent],
+        omega_matrix: np.ndarray,
+        temporary_matrix: Union[np.ndarray, SparseAdjacency],
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        """
+        param agents: all agents of one group, in id order
+        param omega_matrix: matrix of weights, or the weights of the edges
+        of temporary_matrix
+        param temporary_matrix: temporary matrix, dense or as an edge list
+        param rng: random generator, a fresh one if None
+
+        Group-level FJ_update_parameters, every agent of the group is
+        updated from the positions and speeds at the start of the step
+        """
+        if not agents:
+            return
+        positions = np.array([[a.position.x, a.position.y] for a in agents])
+        speeds = np.array([a.speed for a in agents])
+        Para_update_strategies._FJ_update_arrays(
+            positions,
+            speeds,
+            agents[0].boundary,
+            omega_matrix,
+            temporary_matrix,
+            rng,
+        )
+        for agent, position, speed in zip(agents, positions, speeds):
+            agent.position = Point(position)
+            agent.speed = speed
+
+    @staticmethod
+    def FJ_update_group_array(
+        agents: ContiAgentArray,
+        group: slice,
+        omega_matrix: np.ndarray,
+        temporary_matrix: Union[np.ndarray, SparseAdjacency],
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        """
+        param agents: agent arrays
+        param group: rows of the group to update
+        param omega_matrix: matrix of weights, or the weights of the edges
+        of temporary_matrix
+        param temporary_matrix: temporary matrix, dense or as an edge list
+        param rng: random generator, a fresh one if None
+
+        Array counterpart of FJ_update_group, updates the rows in place
+        """
+        Para_update_strategies._FJ_update_arrays(
+            agents.position[group],
+            agents.speed[group],
+            agents.boundary,
+            omega_matrix,
+            temporary_matrix,
+            rng,
+        )
+
+    @staticmethod
+    def FJ_update_edge_list(
+        positions: np.ndarray,
+        speeds: np.ndarray,
+        boundary,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        weights: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        """
+        param positions: (n, 2) positions, updated in place
+        param speeds: (n,) speeds, updated in place
+        param boundary: boundary of the agents
+        param rows, cols: edges rows[k] -> cols[k] of the update matrix
+        param weights: non-negative weight of every edge
+        param rng: random generator, a fresh one if None
+
+        FJ update with the update matrix given as a weighted edge list,
+        costs O(n + edges)
+        """
+        states = np.column_stack([positions, speeds])
+        total_weight = np.bincount(
+            rows, weights=weights, minlength=len(states)
+        )
+        weighted_states = np.column_stack(
+            [
+                np.bincount(
+                    rows,
+                    weights=weights * column[cols],
+                    minlength=len(states),
+                )
+                for column in states.T
+            ]
+        )
+        Para_update_strategies._FJ_apply(
+            positions,
+            speeds,
+            boundary,
+            states,
+            total_weight,
+            weighted_states,
+            rng,
+        )
+
+    @staticmethod
+    def _FJ_update_arrays(
+        positions: np.ndarray,
+        speeds: np.ndarray,
+        boundary,
+        omega_matrix: np.ndarray,
+        temporary_matrix: Union[np.ndarray, SparseAdjacency],
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        if isinstance(temporary_matrix, SparseAdjacency):
+            rows, cols = temporary_matrix.rows, temporary_matrix.cols
+            # a fixed topology keeps its omega weights per edge
+            weights = (
+                omega_matrix
+                if omega_matrix.ndim == 1
+                else omega_matrix[rows, cols]
+            )
+            Para_update_strategies.FJ_update_edge_list(
+                positions, speeds, boundary, rows, cols, weights, rng
+            )
+            return
+
+        # weighted sums of the neighbours' positions and speeds in one
+        # product, and the total weight of every row of the update matrix
+        states = np.column_stack([positions, speeds])
+        update_matrix = np.multiply(temporary_matrix, omega_matrix)
+        total_weight = update_matrix.sum(axis=1)
+        weighted_states = update_matrix @ states
+        Para_update_strategies._FJ_apply(
+            positions,
+            speeds,
+            boundary,
+            states,
+            total_weight,
+            weighted_states,
+            rng,
+        )
+
+    @staticmethod
+    def _FJ_apply(
+        positions: np.ndarray,
+        speeds: np.ndarray,
+        boundary,
+        states: np.ndarray,
+        total_weight: np.ndarray,
+        weighted_states: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
+    ) -> None:
+        rng = np.random.default_rng(rng)
+        update_weight = 0.5
+        beta = 0.5
+
+        # row-normalize, the weights are non-negative; agents without
+        # active neighbours are pulled towards the origin, as in
+        # FJ_update_parameters
+        update_states = (
+            weighted_states
+            / np.where(total_weight > 0, total_weight, 1)[:, np.newaxis]
+        )
+
+        updated_states = (
+            update_weight * update_states + (1 - update_weight) * states
+        )
+        accept = (rng.random(len(speeds)) < beta) & covers_xy(
+            boundary, updated_states[:, 0], updated_states[:, 1]
+        )
+        positions[accept] = updated_states[accept, :2]
+        speeds[accept] = updated_states[accept, 2]
+
     @staticmethod
     def FJ_update_parameters_adapt(
         agent: AgentData,
@@ -154,8 +335,10 @@ class Para_update_strategies:
         omega_matrix: np.ndarray,
         agents: List[AgentData],
         temporary_matrix: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
     ) -> None:
 
+        rng = np.random.default_rng(rng)
         update_weight = 0.1
         noise_weight = 0.1
         min_theta = 10
@@ -191,8 +374,8 @@ class Para_update_strategies:
                     updated_mu_y += weight * agents[i].mu.y
                     updated_theta += weight * agents[i].theta
 
-        noise_x = np.random.normal(0, noise_weight)
-        noise_y = np.random.normal(0, noise_weight)
+        noise_x = rng.normal(0, noise_weight)
+        noise_y = rng.normal(0, noise_weight)
 
         agent.mu = Point(
             update_weight * updated_mu_x
@@ -0,0 +1,71 @@
+import numpy as np
+from shapely import contains_xy as polygon_contains_xy
+from shapely import intersects_xy as polygon_intersects_xy
+from shapely.geometry import Point, Polygon
+
+
+class RectBoundary:
+    """
+    Axis-aligned rectangle centred at the origin, described by its half
+    width and half height only. Expansion is a scalar update and the
+    geometric tests are closed-form, so no shapely geometry is built per
+    step. Offers the parts of the Polygon interface used by the simulator.
+    """
+
+    def __init__(self, half_width: float, half_height: float):
+        self.half_width = half_width
+        self.half_height = half_height
+
+    @property
+    def bounds(self):
+        return (
+            -self.half_width,
+            -self.half_height,
+            self.half_width,
+            self.half_height,
+        )
+
+    @property
+    def exterior(self):
+        return self.to_polygon().exterior
+
+    def scale(self, factor: float) -> None:
+        self.half_width *= factor
+        self.half_height *= factor
+
+    def contains_xy(self, x, y):
+        # strict interior, as Polygon.contains
+        return (np.abs(x) < self.half_width) & (np.abs(y) < self.half_height)
+
+    def covers_xy(self, x, y):
+        # interior or edge, as Polygon.contains or Polygon.touches
+        return (np.abs(x) <= self.half_width) & (np.abs(y) <= self.half_height)
+
+    def contains(self, point: Point) -> bool:
+        return bool(self.contains_xy(point.x, point.y))
+
+    def touches(self, point: Point) -> bool:
+        return bool(
+            self.covers_xy(point.x, point.y)
+            and not self.contains_xy(point.x, point.y)
+        )
+
+    def to_polygon(self) -> Polygon:
+        min_x, min_y, max_x, max_y = self.bounds
+        return Polygon(
+            [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
+        )
+
+
+def contains_xy(boundary, x, y):
+    # vectorized strict containment for a RectBoundary or a shapely Polygon
+    if isinstance(boundary, RectBoundary):
+        return boundary.contains_xy(x, y)
+    return polygon_contains_xy(boundary, x, y)
+
+
+def covers_xy(boundary, x, y):
+    # vectorized containment including the edge
+    if isinstance(boundary, RectBoundary):
+        return boundary.covers_xy(x, y)
+    return polygon_intersects_xy(boundary, x, y)
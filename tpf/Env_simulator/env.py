@@ -1,4 +1,7 @@
 import numpy as np
+from Env_simulator.boundary import RectBoundary
+from Env_simulator.transition import SparseTransitionCounts
+from interface import Target
 from shapely.affinity import scale
 from shapely.geometry import Point, Polygon
 
@@ -12,25 +15,73 @@ class Env:
         velocity,
         initial_boundary_width,
         expansion_times,
+        parametric_boundary=True,
+        rng=None,
+        num_targets=1,
     ):
+        """
+        param parametric_boundary: keep the square boundary as a
+        RectBoundary (half width scaled in place) instead of a shapely
+        Polygon rebuilt by shapely.affinity.scale on every expansion
+        param rng: numpy random Generator (or seed) of the hole
+        param num_targets: number of holes moving at once; the first one
+        is the hole (hole_x, hole_y, direction)
+        """
+        self.rng = np.random.default_rng(rng)
         self.radius = radius
         self.velocity = velocity
         self.width = width
         self.height = height
         self.initial_boundary_width = initial_boundary_width
+        self.parametric_boundary = parametric_boundary
         self.boundary = self.create_square_boundary()
-        self.hole_x, self.hole_y = (
-            self.generate_random_position_within_boundary()
-        )
-        self.direction = np.random.uniform(0, 2 * np.pi)
+        self.targets = [self.create_target(i) for i in range(num_targets)]
         self.expansion_times = expansion_times
-        self.state_transition_matrix = (
+        self.state_transition_counts = (
             self.initialize_state_transition_matrix()
         )
         self.time_step = 0
 
+    def create_target(self, target_id):
+        x, y = self.generate_random_position_within_boundary()
+        direction = self.rng.uniform(0, 2 * np.pi)
+        return Target(target_id, x, y, direction)
+
+    @property
+    def hole_x(self):
+        return self.targets[0].x
+
+    @hole_x.setter
+    def hole_x(self, x):
+        self.targets[0].x = x
+
+    @property
+    def hole_y(self):
+        return self.targets[0].y
+
+    @hole_y.setter
+    def hole_y(self, y):
+        self.targets[0].y = y
+
+    @property
+    def direction(self):
+        return self.targets[0].direction
+
+    @direction.setter
+    def direction(self, direction):
+        self.targets[0].direction = direction
+
+    def get_targets(self):
+        return self.targets
+
+    def get_target_centers(self):
+        # (target, 2) array of the target positions
+        return np.array([(target.x, target.y) for target in self.targets])
+
     def create_square_boundary(self):
         side_length = self.initial_boundary_width
+        if self.parametric_boundary:
+            return RectBoundary(side_length / 2, side_length / 2)
         square = Polygon(
             [
                 (-side_length / 2, -side_length / 2),
@@ -44,15 +95,15 @@ class Env:
     def generate_random_position_within_boundary(self):
         min_x, min_y, max_x, max_y = self.boundary.bounds
         while True:
-            x = np.random.uniform(min_x, max_x)
-            y = np.random.uniform(min_y, max_y)
+            x = self.rng.uniform(min_x, max_x)
+            y = self.rng.uniform(min_y, max_y)
             point = Point(x, y)
             if self.boundary.contains(point):
                 return x, y
 
     def initialize_state_transition_matrix(self):
         size = int((self.initial_boundary_width * self.expansion_times) ** 2)
-        return np.zeros((size, size))
+        return SparseTransitionCounts(size)
 
     def get_state_index(self, x, y):
         min_x, min_y, max_x, max_y = self.boundary.bounds
@@ -71,36 +122,50 @@ class Env:
     def update_state_transition_matrix(self, prev_x, prev_y, new_x, new_y):
         prev_state = self.get_state_index(prev_x, prev_y)
         new_state = self.get_state_index(new_x, new_y)
-        if (
-            prev_state >= self.state_transition_matrix.shape[0]
-            or new_state >= self.state_transition_matrix.shape[0]
-        ):
+        num_states = self.state_transition_counts.num_states
+        if not (0 <= prev_state < num_states and 0 <= new_state < num_states):
             return
-        self.state_transition_matrix[prev_state, new_state] += 1
-        self.state_transition_matrix[
-            prev_state
-        ] /= self.state_transition_matrix[prev_state].sum()
+        # counts only, rows are normalized on export
+        self.state_transition_counts.add(prev_state, new_state)
+
+    def get_state_transition_matrix(self, sparse=True):
+        """
+        param sparse: return (data, indices, indptr) in CSR layout instead
+        of a dense matrix
+
+        Row-normalized state transition probabilities of the hole
+        """
+        if sparse:
+            return self.state_transition_counts.to_csr()
+        return self.state_transition_counts.to_dense()
 
     def update_velocity(self):
         self.velocity = 1 + np.sin(self.time_step * 0.1)
 
     def move_hole(self, dt):
+        # move every target, return the new position of the first one
         self.update_velocity()
         self.time_step += 1
-        new_x = self.hole_x + self.velocity * np.cos(self.direction) * dt
-        new_y = self.hole_y + self.velocity * np.sin(self.direction) * dt
+        new_positions = [
+            self.move_target(target, dt) for target in self.targets
+        ]
+        return new_positions[0]
+
+    def move_target(self, target, dt):
+        new_x = target.x + self.velocity * np.cos(target.direction) * dt
+        new_y = target.y + self.velocity * np.sin(target.direction) * dt
         new_position = Point(new_x, new_y)
 
         if not self.boundary.contains(new_position):
             normal_vector = self.calculate_normal_vector(new_position)
-            self.direction = self.reflect_direction(
-                self.direction, normal_vector
+            target.direction = self.reflect_direction(
+                target.direction, normal_vector
             )
-            new_x = self.hole_x + self.velocity * np.cos(self.direction) * dt
-            new_y = self.hole_y + self.velocity * np.sin(self.direction) * dt
+            new_x = target.x + self.velocity * np.cos(target.direction) * dt
+            new_y = target.y + self.velocity * np.sin(target.direction) * dt
             new_position = Point(new_x, new_y)
 
-        self.hole_x, self.hole_y = new_x, new_y
+        target.x, target.y = new_x, new_y
         return new_position
 
     def calculate_normal_vector(self, point):
@@ -122,12 +187,70 @@ class Env:
         return np.arctan2(reflection_vector[1], reflection_vector[0])
 
     def expand_boundary(self, factor):
+        if isinstance(self.boundary, RectBoundary):
+            self.boundary.scale(factor)
+            return
         self.boundary = scale(
             self.boundary, xfact=factor, yfact=factor, origin=(0, 0)
         )
 
+    def get_state(self):
+        """
+        Dynamic state of the environment (hole, boundary and transition
+        counts) as plain arrays, see set_state
+        """
+        if isinstance(self.boundary, RectBoundary):
+            boundary = np.array(
+                [self.boundary.half_width, self.boundary.half_height]
+            )
+        else:
+            boundary = np.array(self.boundary.exterior.coords)
+        rows, cols, counts = self.state_transition_counts.to_coo()
+        return {
+            "hole": np.array(
+                [
+                    self.hole_x,
+                    self.hole_y,
+                    self.direction,
+                    self.velocity,
+                    self.time_step,
+                ]
+            ),
+            "targets": np.array(
+                [
+                    (target.x, target.y, target.direction)
+                    for target in self.targets
+                ]
+            ),
+            "boundary": boundary,
+            "transition_rows": rows,
+            "transition_cols": cols,
+            "transition_counts": counts,
+        }
+
+    def set_state(self, state):
+        # the position of the first target in "hole" repeats "targets"
+        *_, velocity, time_step = state["hole"]
+        self.velocity = float(velocity)
+        self.time_step = int(time_step)
+        self.targets = [
+            Target(i, float(x), float(y), float(direction))
+            for i, (x, y, direction) in enumerate(state["targets"])
+        ]
+        if self.parametric_boundary:
+            self.boundary = RectBoundary(*state["boundary"])
+        else:
+            self.boundary = Polygon(state["boundary"])
+        self.state_transition_counts = SparseTransitionCounts.from_coo(
+            self.state_transition_counts.num_states,
+            state["transition_rows"],
+            state["transition_cols"],
+            state["transition_counts"],
+        )
+
     def get_boundary(self):
         return self.boundary
 
     def get_target_hole(self):
+        # shapely disc of the first target
         return Point(self.hole_x, self.hole_y).buffer(self.radius)
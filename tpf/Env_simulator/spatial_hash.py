@@ -0,0 +1,79 @@
+from typing import Tuple
+
+import numpy as np
+
+
+class SpatialHashGrid:
+    """
+    Uniform grid over agent positions. build() sorts the agents by cell
+    once per step; a circle query then only tests the agents in the cells
+    its bounding box overlaps instead of every agent. With cells of at
+    least the target diameter every target overlaps at most 2 x 2 cells.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+        self.positions = np.zeros((0, 2))
+
+    # cell coordinates are shifted into [0, 2^31) and packed in one int64
+    _offset = 1 << 30
+
+    def _cell(self, xy: np.ndarray) -> np.ndarray:
+        return np.floor(xy / self.cell_size).astype(np.int64) + self._offset
+
+    def _key(self, cell_x: np.ndarray, cell_y: np.ndarray) -> np.ndarray:
+        return (cell_x << 31) | cell_y
+
+    def build(self, positions: np.ndarray) -> None:
+        """
+        param positions: (n, 2) agent positions
+        """
+        self.positions = positions
+        cells = self._cell(positions)
+        keys = self._key(cells[:, 0], cells[:, 1])
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def query_circles(
+        self, centers: np.ndarray, radius: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        param centers: (t, 2) circle centres
+        param radius: radius shared by all circles
+
+        Return (circle ids, agent ids) of every agent strictly inside a
+        circle, as calculate_hits_in_circle
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        low = self._cell(centers - radius)
+        high = self._cell(centers + radius)
+        span = int(max((high - low).max(initial=0), 0)) + 1
+
+        # candidate cells of every circle: its bounding box, span x span
+        offsets = np.arange(span)
+        cell_x = low[:, 0, None, None] + offsets[None, :, None]
+        cell_y = low[:, 1, None, None] + offsets[None, None, :]
+        cell_x, cell_y = np.broadcast_arrays(cell_x, cell_y)
+        valid = (cell_x <= high[:, 0, None, None]) & (
+            cell_y <= high[:, 1, None, None]
+        )
+        circle = np.broadcast_to(
+            np.arange(len(centers))[:, None, None], valid.shape
+        )[valid]
+        keys = self._key(cell_x[valid], cell_y[valid])
+
+        # agents of those cells, as ranges of the sorted keys
+        starts = np.searchsorted(self.sorted_keys, keys, side="left")
+        ends = np.searchsorted(self.sorted_keys, keys, side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        candidate_circle = np.repeat(circle, lengths)
+        first = np.cumsum(lengths) - lengths
+        sorted_index = np.arange(total) - np.repeat(first - starts, lengths)
+        candidate_agent = self.order[sorted_index]
+
+        offset = self.positions[candidate_agent] - centers[candidate_circle]
+        inside = np.einsum("ij,ij->i", offset, offset) < radius**2
+        return candidate_circle[inside], candidate_agent[inside]
@@ -0,0 +1,86 @@
+from collections import defaultdict
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+class SparseTransitionCounts:
+    """
+    State transition counts of the hole, kept as a dict of keys with
+    integer counts. Only the visited transitions are stored; probabilities
+    are computed on export.
+    """
+
+    def __init__(self, num_states: int):
+        self.num_states = num_states
+        self.counts: Dict[Tuple[int, int], int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.num_states, self.num_states
+
+    @classmethod
+    def from_coo(
+        cls, num_states: int, rows, cols, counts
+    ) -> "SparseTransitionCounts":
+        transition_counts = cls(num_states)
+        for prev_state, new_state, count in zip(rows, cols, counts):
+            transition_counts.add(int(prev_state), int(new_state), int(count))
+        return transition_counts
+
+    def add(self, prev_state: int, new_state: int, count: int = 1) -> None:
+        self.counts[(prev_state, new_state)] += count
+
+    def to_coo(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return (rows, cols, counts) sorted by row, then column
+        """
+        if not self.counts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        keys = np.array(list(self.counts.keys()), dtype=np.int64)
+        counts = np.fromiter(
+            self.counts.values(), dtype=np.int64, count=len(self.counts)
+        )
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        return keys[order, 0], keys[order, 1], counts[order]
+
+    def _normalize(self, rows, counts) -> np.ndarray:
+        row_sums = np.bincount(rows, weights=counts, minlength=self.num_states)
+        return counts / row_sums[rows]
+
+    def to_csr(
+        self, normalize: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        param normalize: turn every row of counts into probabilities
+
+        Return (data, indices, indptr) in scipy.sparse.csr_matrix layout
+        """
+        rows, cols, counts = self.to_coo()
+        data = self._normalize(rows, counts) if normalize else counts
+        indptr = np.zeros(self.num_states + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.num_states), out=indptr[1:])
+        return data, cols, indptr
+
+    def to_dense(self, normalize: bool = True) -> np.ndarray:
+        rows, cols, counts = self.to_coo()
+        data = self._normalize(rows, counts) if normalize else counts
+        matrix = np.zeros(self.shape)
+        matrix[rows, cols] = data
+        return matrix
+
+    def save_npz(self, path: str, normalize: bool = True) -> None:
+        # same keys as scipy.sparse.save_npz, readable by load_npz
+        data, indices, indptr = self.to_csr(normalize)
+        np.savez(
+            path,
+            data=data,
+            indices=indices,
+            indptr=indptr,
+            format=b"csr",
+            shape=np.array(self.shape),
+        )
@@ -0,0 +1,206 @@
+import os
+import pickle
+import warnings
+from collections import OrderedDict
+from dataclasses import fields, replace
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import networkx as nx
+from interface import GraphData
+from networkx.algorithms.isomorphism import DiGraphMatcher
+
+# dict fields of the features that are not keyed by node or edge
+GRAPH_FIELDS = ["error_bounds"]
+
+# node and edge attributes of label_graph
+NODE_LABEL = "anchor"
+EDGE_LABEL = "weight_label"
+
+
+def label_graph(
+    graph: nx.DiGraph, anchors: Iterable[Hashable] = ()
+) -> nx.DiGraph:
+    # copy of graph with the string labels to hash: every anchor carries
+    # its own label ("" on the other nodes), every edge its weight
+    labelled = nx.DiGraph()
+    labelled.add_nodes_from(graph, **{NODE_LABEL: ""})
+    nx.set_node_attributes(
+        labelled,
+        {anchor: repr(anchor) for anchor in anchors if anchor in graph},
+        NODE_LABEL,
+    )
+    labelled.add_edges_from(
+        (
+            u,
+            v,
+            {
+                "weight": weight,
+                EDGE_LABEL: "" if weight is None else repr(float(weight)),
+            },
+        )
+        for u, v, weight in graph.edges(data="weight")
+    )
+    return labelled
+
+
+def graph_fingerprint(
+    graph: nx.DiGraph, anchors: Iterable[Hashable] = ()
+) -> str:
+    """
+    param anchors: nodes whose label the features depend on, they are
+    only matched to themselves
+
+    Weisfeiler-Lehman hash of the graph and its edge weights, prefixed
+    with the node and edge counts. Isomorphic graphs share it; graphs that
+    share it are not necessarily isomorphic, see match_graphs.
+    """
+    with warnings.catch_warnings():
+        # networkx 3.5 changed the hashes of digraphs; a cache written by
+        # an older version only misses
+        warnings.simplefilter("ignore", UserWarning)
+        wl_hash = nx.weisfeiler_lehman_graph_hash(
+            label_graph(graph, anchors),
+            edge_attr=EDGE_LABEL,
+            node_attr=NODE_LABEL,
+        )
+    return f"{graph.number_of_nodes()}_{graph.number_of_edges()}_{wl_hash}"
+
+
+def match_graphs(
+    graph: nx.DiGraph,
+    cached: nx.DiGraph,
+    anchors: Iterable[Hashable] = (),
+) -> Optional[Dict[Hashable, Hashable]]:
+    """
+    Return a mapping of the nodes of graph to the nodes of cached that
+    preserves edges, edge weights and anchors, None if the graphs are not
+    isomorphic
+    """
+    if list(graph) == list(cached) and list(
+        graph.edges(data="weight")
+    ) == list(cached.edges(data="weight")):
+        return {node: node for node in graph}
+    matcher = DiGraphMatcher(
+        label_graph(graph, anchors),
+        label_graph(cached, anchors),
+        node_match=lambda a, b: a[NODE_LABEL] == b[NODE_LABEL],
+        edge_match=lambda a, b: a["weight"] == b["weight"],
+    )
+    if not matcher.is_isomorphic():
+        return None
+    return matcher.mapping
+
+
+def remap_features(
+    features: Any, graph_data: GraphData, mapping: Dict[Hashable, Hashable]
+) -> Any:
+    """
+    param features: GraphFeatures or TaskGraphFeatures of the cached graph
+    param mapping: match_graphs(graph_data.graph, cached graph)
+
+    Return features for graph_data: its id and the per node (per edge for
+    the edge_* fields) values keyed and ordered by the nodes of graph_data
+    """
+    remapped = {"id": graph_data.id}
+    graph = graph_data.graph
+    for feature in fields(features):
+        values = getattr(features, feature.name)
+        if not isinstance(values, dict) or feature.name in GRAPH_FIELDS:
+            continue
+        if feature.name.startswith("edge_"):
+            remapped[feature.name] = {
+                (u, v): values[(mapping[u], mapping[v])]
+                for u, v in graph.edges
+            }
+        else:
+            remapped[feature.name] = {
+                node: values[mapping[node]] for node in graph
+            }
+    return replace(features, **remapped)
+
+
+class FeatureCache:
+    """
+    Features of graphs keyed by graph_fingerprint: graphs isomorphic to a
+    cached one reuse its features, remapped to their id and nodes. Hash
+    collisions are told apart with match_graphs, so a fingerprint keeps a
+    list of (graph, features) entries.
+
+    The max_size most recently used fingerprints are held in memory; with
+    a path every fingerprint is also stored as {path}{fingerprint}.pkl
+    and found again by later runs. The path should change along with the
+    features it caches.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_size: int = 256,
+        anchors: Iterable[Hashable] = (),
+    ):
+        """
+        param anchors: nodes the features depend on by label, e.g. the
+        sink 0 of the task graphs; see graph_fingerprint
+        """
+        self.path = path
+        self.max_size = max_size
+        self.anchors = tuple(anchors)
+        self.entries: OrderedDict[str, List[Tuple[nx.DiGraph, Any]]] = (
+            OrderedDict()
+        )
+
+    def fingerprint(self, graph: nx.DiGraph) -> str:
+        return graph_fingerprint(graph, self.anchors)
+
+    def _file(self, fingerprint: str) -> str:
+        return f"{self.path}{fingerprint}.pkl"
+
+    def _load(self, fingerprint: str) -> List[Tuple[nx.DiGraph, Any]]:
+        if fingerprint in self.entries:
+            self.entries.move_to_end(fingerprint)
+            return self.entries[fingerprint]
+        entries = []
+        if self.path is not None and os.path.exists(self._file(fingerprint)):
+            with open(self._file(fingerprint), "rb") as f:
+                entries = pickle.load(f)
+        self._keep(fingerprint, entries)
+        return entries
+
+    def _keep(self, fingerprint: str, entries: List) -> None:
+        self.entries[fingerprint] = entries
+        self.entries.move_to_end(fingerprint)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(
+        self, graph_data: GraphData, fingerprint: Optional[str] = None
+    ) -> Optional[Any]:
+        """
+        Return the cached features of a graph isomorphic to graph_data,
+        remapped to it, None if there is none
+        """
+        fingerprint = fingerprint or self.fingerprint(graph_data.graph)
+        for cached, features in self._load(fingerprint):
+            mapping = match_graphs(graph_data.graph, cached, self.anchors)
+            if mapping is not None:
+                return remap_features(features, graph_data, mapping)
+        return None
+
+    def put(
+        self,
+        graph_data: GraphData,
+        features: Any,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        fingerprint = fingerprint or self.fingerprint(graph_data.graph)
+        entries = self._load(fingerprint) + [
+            (graph_data.graph.copy(), features)
+        ]
+        self._keep(fingerprint, entries)
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            # write then rename, a reader never sees a partial file
+            temp_file = f"{self._file(fingerprint)}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as f:
+                pickle.dump(entries, f)
+            os.replace(temp_file, self._file(fingerprint))
@@ -1,36 +1,248 @@
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import networkx as nx
+import numpy as np
 import pandas as pd
+from interface import EdgeListGraph, GraphData
 from utils import save_file
 
+from .feature_cache import FeatureCache, match_graphs, remap_features
 from .mas_feature import AgentFeatures as Af
 from .mas_feature_eval import MASFeatureEvaluator as Mfe
 from .task_feature import TaskFeatures as Tf
 from .task_feature_eval import TaskFeatureEvaluator as Tfe
 
 
+def to_edge_list(graph_data: GraphData) -> EdgeListGraph:
+    """
+    Compact form of graph_data to send to a worker process, far smaller
+    to pickle than the nx.DiGraph; from_edge_list rebuilds the graph with
+    the same node and edge order. Edge "weight" attributes are kept if
+    every edge has one, other attributes are dropped.
+    """
+    graph = graph_data.graph
+    nodes = list(graph)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = np.array(
+        [(index[u], index[v]) for u, v in graph.edges],
+        dtype=np.min_scalar_type(len(nodes)),
+    ).reshape(-1, 2)
+    weights = [weight for _, _, weight in graph.edges(data="weight")]
+    return EdgeListGraph(
+        id=graph_data.id,
+        type=graph_data.type,
+        name=graph_data.name,
+        nodes=nodes,
+        edges=edges,
+        weights=None if None in weights else np.array(weights),
+    )
+
+
+def from_edge_list(edge_list: EdgeListGraph) -> GraphData:
+    graph = nx.DiGraph()
+    graph.add_nodes_from(edge_list.nodes)
+    nodes = edge_list.nodes
+    pairs = [(nodes[u], nodes[v]) for u, v in edge_list.edges.tolist()]
+    if edge_list.weights is None:
+        graph.add_edges_from(pairs)
+    else:
+        graph.add_weighted_edges_from(
+            (u, v, weight)
+            for (u, v), weight in zip(pairs, edge_list.weights.tolist())
+        )
+    return GraphData(
+        graph=graph,
+        id=edge_list.id,
+        type=edge_list.type,
+        name=edge_list.name,
+    )
+
+
+def calculate_from_edge_list(
+    calculate: Callable[[GraphData], Any], edge_list: EdgeListGraph
+) -> Any:
+    return calculate(from_edge_list(edge_list))
+
+
+def calculate_all(
+    calculate: Callable[[GraphData], Any],
+    graphs: List[GraphData],
+    max_workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    cache: Optional[FeatureCache] = None,
+) -> List[Any]:
+    """
+    param calculate: picklable feature function of one graph, e.g.
+    AgentFeatures.calculate_features
+    param max_workers: number of worker processes, os.cpu_count() if
+    None; 1 runs in this process
+    param chunksize: number of graphs sent to a worker at once, about
+    four chunks per worker if None
+    param cache: features of calculate already known; only one graph of
+    every isomorphism class missing from it is calculated, the others
+    reuse its features
+
+    Return calculate of every graph, in the order of graphs
+    """
+    if cache is None:
+        return calculate_graphs(calculate, graphs, max_workers, chunksize)
+
+    fingerprints = [cache.fingerprint(graph.graph) for graph in graphs]
+    results = [
+        cache.get(graph, fingerprint)
+        for graph, fingerprint in zip(graphs, fingerprints)
+    ]
+    # graphs to calculate, one per isomorphism class, by fingerprint
+    representatives: Dict[str, List[int]] = {}
+    copies = []  # (index, index of its representative, node mapping)
+    for i, fingerprint in enumerate(fingerprints):
+        if results[i] is not None:
+            continue
+        for j in representatives.get(fingerprint, []):
+            mapping = match_graphs(
+                graphs[i].graph, graphs[j].graph, cache.anchors
+            )
+            if mapping is not None:
+                copies.append((i, j, mapping))
+                break
+        else:
+            representatives.setdefault(fingerprint, []).append(i)
+
+    calculated = [i for indices in representatives.values() for i in indices]
+    features = calculate_graphs(
+        calculate, [graphs[i] for i in calculated], max_workers, chunksize
+    )
+    for i, graph_features in zip(calculated, features):
+        results[i] = graph_features
+        cache.put(graphs[i], graph_features, fingerprints[i])
+    for i, j, mapping in copies:
+        results[i] = remap_features(results[j], graphs[i], mapping)
+    logging.info(
+        f"Features of {len(graphs)} graphs, {len(calculated)} calculated"
+    )
+    return results
+
+
+def calculate_graphs(
+    calculate: Callable[[GraphData], Any],
+    graphs: List[GraphData],
+    max_workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> List[Any]:
+    # calculate_all without a cache
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1 or len(graphs) <= 1:
+        return [calculate(graph) for graph in graphs]
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(graphs) / (4 * max_workers)))
+    edge_lists = [to_edge_list(graph) for graph in graphs]
+    with ProcessPoolExecutor(max_workers) as executor:
+        return list(
+            executor.map(
+                partial(calculate_from_edge_list, calculate),
+                edge_lists,
+                chunksize=chunksize,
+            )
+        )
+
+
 class FeatureAnalyse:
-    def __init__(self, load_graph: pd.DataFrame, storage_path: str):
+    def __init__(
+        self,
+        load_graph: pd.DataFrame,
+        storage_path: str,
+        use_cache: bool = True,
+    ):
+        """
+        param use_cache: reuse the features of isomorphic graphs, also
+        across runs through the cache files under storage_path
+        """
         self.storage_path = storage_path
         self.graph_list = load_graph
+        self.use_cache = use_cache
+        self.caches: Dict[str, FeatureCache] = {}
 
-    def mas_feature(self):
-        feature_list = []
-        for index, row in self.graph_list.iterrows():
-            graph = row["data"]
-            topo = row["topology"]
-            mas_features = Af.calculate_features(graph)
-            feature_list.append({"topology": topo, "feature": mas_features})
-        df_mas_feature = pd.DataFrame(feature_list)
+    def feature_cache(
+        self, name: str, anchors: Iterable[Hashable] = ()
+    ) -> Optional[FeatureCache]:
+        # cache of the features named name, kept across calls
+        if not self.use_cache:
+            return None
+        if name not in self.caches:
+            self.caches[name] = FeatureCache(
+                f"{self.storage_path}cache/{name}/", anchors=anchors
+            )
+        return self.caches[name]
+
+    def mas_feature(
+        self,
+        max_workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        mode: str = "exact",
+        num_samples: int = 100,
+        seed: Optional[int] = None,
+    ):
+        """
+        param max_workers, chunksize: see calculate_all
+        param mode, num_samples, seed: see AgentFeatures.calculate_features;
+        approximate features are only cached with a seed, without one the
+        pivots change from run to run
+        """
+        cache = self.feature_cache("mas_exact")
+        if mode == "approximate":
+            cache = None
+            if seed is not None:
+                cache = self.feature_cache(
+                    f"mas_pivots_k{num_samples}_seed{seed}"
+                )
+        mas_features = calculate_all(
+            partial(
+                Af.calculate_features,
+                mode=mode,
+                num_samples=num_samples,
+                seed=seed,
+            ),
+            self.graph_list["data"].tolist(),
+            max_workers,
+            chunksize,
+            cache,
+        )
+        df_mas_feature = pd.DataFrame(
+            {
+                "topology": self.graph_list["topology"].tolist(),
+                "feature": mas_features,
+            }
+        )
         save_file(df_mas_feature, f"{self.storage_path}mas_features.pkl")
         return df_mas_feature
 
-    def task_feature(self):
-        feature_list = []
-        for index, row in self.graph_list.iterrows():
-            graph = row["data"]
-            topo = row["topology"]
-            task_features = Tf.calculate_features(graph)
-            feature_list.append({"topology": topo, "feature": task_features})
-        df_task_feature = pd.DataFrame(feature_list)
+    def task_feature(
+        self,
+        max_workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+    ):
+        """
+        param max_workers, chunksize: see calculate_all
+        """
+        task_features = calculate_all(
+            Tf.calculate_features,
+            self.graph_list["data"].tolist(),
+            max_workers,
+            chunksize,
+            # the path length entropy runs from every node to the sink 0
+            self.feature_cache("task", anchors=[0]),
+        )
+        df_task_feature = pd.DataFrame(
+            {
+                "topology": self.graph_list["topology"].tolist(),
+                "feature": task_features,
+            }
+        )
         save_file(df_task_feature, f"{self.storage_path}task_features.pkl")
         return df_task_feature
 
@@ -1,80 +1,329 @@
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 import networkx as nx
 import numpy as np
 from interface import GraphData, GraphFeatures
 
+# how calculate_features computes the path based features
+FEATURE_MODES = ["exact", "approximate"]
+
 
 class AgentFeatures:
     @classmethod
-    def calculate_node_independence(cls, graph: nx.DiGraph) -> Dict:
-        n = len(graph)
-        independence = {}
-        max_distance = np.max(
-            [
-                d
-                for u in graph
-                for d in nx.single_source_shortest_path_length(
-                    graph, u
-                ).values()
-            ]
-        )
-        for node in graph:
-            total = sum(
-                1
-                - (nx.shortest_path_length(graph, node, target) / max_distance)
-                for target in graph
-                if node != target
+    def calculate_distance_matrix(cls, graph: nx.DiGraph) -> np.ndarray:
+        """
+        Shortest path lengths between all nodes, one BFS per node:
+        distances[i, j] is the number of hops from the i-th to the j-th node
+        of the graph (in graph order), inf if j is unreachable from i
+        """
+        index = {node: i for i, node in enumerate(graph)}
+        distances = np.full((len(graph), len(graph)), np.inf)
+        for source, lengths in nx.all_pairs_shortest_path_length(graph):
+            row = distances[index[source]]
+            row[[index[target] for target in lengths]] = list(lengths.values())
+        return distances
+
+    @staticmethod
+    def check_strongly_connected(distances: np.ndarray) -> None:
+        # the path based features are only defined if every node is reachable
+        if not np.isfinite(distances).all():
+            raise nx.NetworkXError(
+                "Found infinite path length because the digraph is not "
+                "strongly connected"
             )
-            independence[node] = total / (n - 1)
-        return independence
 
     @classmethod
-    def calculate_second_order_centrality(cls, graph: nx.DiGraph) -> Dict:
-        soc = {}
-        for node in graph:
-            soc[node] = np.std(
-                [
-                    nx.shortest_path_length(graph, node, target)
-                    for target in graph
-                    if node != target
-                ]
-            )
-        return soc
+    def calculate_node_independence(
+        cls, graph: nx.DiGraph, distances: Optional[np.ndarray] = None
+    ) -> Dict:
+        """
+        param distances: calculate_distance_matrix(graph), computed if None
+        """
+        if distances is None:
+            distances = cls.calculate_distance_matrix(graph)
+        cls.check_strongly_connected(distances)
+        n = len(graph)
+        max_distance = distances.max()
+        # the diagonal adds 1 - 0 to every row, hence the n - 1 terms
+        total = n - (distances / max_distance).sum(axis=1) - 1
+        return dict(zip(graph, (total / (n - 1)).tolist()))
+
+    @classmethod
+    def calculate_second_order_centrality(
+        cls, graph: nx.DiGraph, distances: Optional[np.ndarray] = None
+    ) -> Dict:
+        """
+        param distances: calculate_distance_matrix(graph), computed if None
+        """
+        if distances is None:
+            distances = cls.calculate_distance_matrix(graph)
+        cls.check_strongly_connected(distances)
+        off_diagonal = ~np.eye(len(graph), dtype=bool)
+        soc = distances[off_diagonal].reshape(len(graph), -1).std(axis=1)
+        return dict(zip(graph, soc.tolist()))
+
+    @classmethod
+    def calculate_closeness_centrality(
+        cls, graph: nx.DiGraph, distances: np.ndarray
+    ) -> Dict:
+        # as nx.closeness_centrality: incoming distances, Wasserman and
+        # Faust scaling for the nodes reaching only part of the graph
+        reachable = np.isfinite(distances)
+        total = np.where(reachable, distances, 0).sum(axis=0)
+        count = reachable.sum(axis=0) - 1.0
+        closeness = np.zeros(len(graph))
+        np.divide(count, total, out=closeness, where=total > 0)
+        if len(graph) > 1:
+            closeness *= count / (len(graph) - 1)
+        return dict(zip(graph, closeness.tolist()))
+
+    @classmethod
+    def calculate_eccentricity(
+        cls, graph: nx.DiGraph, distances: np.ndarray
+    ) -> Dict:
+        cls.check_strongly_connected(distances)
+        return dict(zip(graph, distances.max(axis=1).astype(int).tolist()))
 
     @staticmethod
     def calculate_average_centrality(centrality_dict):
         return sum(centrality_dict.values()) / len(centrality_dict)
 
+    @staticmethod
+    def sample_pivots(
+        graph: nx.DiGraph, num_samples: int, seed: Optional[int] = None
+    ) -> List:
+        nodes = list(graph)
+        rng = np.random.default_rng(seed)
+        return [nodes[i] for i in rng.choice(len(nodes), num_samples, False)]
+
+    @staticmethod
+    def calculate_pivot_distances(
+        graph: nx.DiGraph, pivots: List
+    ) -> np.ndarray:
+        """
+        distances[s, i] is the number of hops from pivots[s] to the i-th
+        node of the graph; raise nx.NetworkXError if one is unreachable
+        """
+        index = {node: i for i, node in enumerate(graph)}
+        distances = np.full((len(pivots), len(graph)), -1, dtype=np.int32)
+        for row, pivot in zip(distances, pivots):
+            lengths = nx.single_source_shortest_path_length(graph, pivot)
+            row[[index[node] for node in lengths]] = list(lengths.values())
+        if (distances < 0).any():
+            raise nx.NetworkXError(
+                "Found infinite path length because the digraph is not "
+                "strongly connected"
+            )
+        return distances
+
+    @staticmethod
+    def calculate_pivot_betweenness(
+        graph: nx.DiGraph, pivots: List
+    ) -> Tuple[Dict, Dict]:
+        """
+        Betweenness and edge betweenness estimated from the shortest paths
+        that start at the pivots, scaled like the k pivot estimates of
+        networkx: the mean over the pivots, over the other pivots for the
+        betweenness of a pivot
+        """
+        num_nodes = len(graph)
+        num_pivots = len(pivots)
+        betweenness = nx.betweenness_centrality_subset(
+            graph, pivots, list(graph)
+        )
+        edge_betweenness = nx.edge_betweenness_centrality_subset(
+            graph, pivots, list(graph)
+        )
+        for node in pivots:
+            betweenness[node] *= num_pivots / (num_pivots - 1)
+        return (
+            {
+                node: value / (num_pivots * (num_nodes - 2))
+                for node, value in betweenness.items()
+            },
+            {
+                edge: value / (num_pivots * (num_nodes - 1))
+                for edge, value in edge_betweenness.items()
+            },
+        )
+
+    @staticmethod
+    def hoeffding_bound(
+        value_range: float, num_samples: int, confidence: float
+    ) -> float:
+        # half width of the confidence interval of the mean of num_samples
+        # independent samples, all within value_range (Hoeffding)
+        return value_range * np.sqrt(
+            np.log(2 / (1 - confidence)) / (2 * max(num_samples, 1))
+        )
+
+    @classmethod
+    def calculate_exact_path_features(cls, graph: nx.DiGraph) -> Dict:
+        distances = cls.calculate_distance_matrix(graph)
+        eccentricity = cls.calculate_eccentricity(graph, distances)
+        return {
+            "betweenness_centrality": nx.betweenness_centrality(graph),
+            "edge_betweenness_centrality": nx.edge_betweenness_centrality(
+                graph
+            ),
+            "closeness_centrality": cls.calculate_closeness_centrality(
+                graph, distances
+            ),
+            "eccentricity": eccentricity,
+            "diameter": max(eccentricity.values()),
+            "radius": min(eccentricity.values()),
+            "node_independence": cls.calculate_node_independence(
+                graph, distances
+            ),
+            "second_order_centrality": cls.calculate_second_order_centrality(
+                graph, distances
+            ),
+        }
+
+    @classmethod
+    def calculate_approximate_path_features(
+        cls,
+        graph: nx.DiGraph,
+        num_samples: int,
+        seed: Optional[int] = None,
+        confidence: float = 0.95,
+    ) -> Dict:
+        """
+        Estimate the path based features from num_samples pivots instead of
+        all pairs: O(num_samples x edges) time, O(num_samples x nodes)
+        memory.
+
+        All estimates share the same pivots. Betweenness and edge
+        betweenness sum the shortest paths from the pivots, every pivot adds
+        a value in [0, 1] to their mean. Closeness, node independence and
+        second order centrality use the distances between every node and
+        the pivots. Eccentricities lie between the farthest
+        pivot and min over pivots of d(node, pivot) + ecc(pivot); the lower
+        bound is the estimate, the diameter and radius are its max and min.
+
+        error_bounds holds, by feature, the Hoeffding half width at
+        confidence (betweenness, edge betweenness, node independence given
+        the diameter), its propagation to closeness, or the largest gap of
+        the eccentricity, diameter and radius bounds; it also bounds the
+        average of the feature. The second order centrality has no bound.
+        """
+        pivots = cls.sample_pivots(graph, num_samples, seed)
+        betweenness, edge_betweenness = cls.calculate_pivot_betweenness(
+            graph, pivots
+        )
+        index = {node: i for i, node in enumerate(graph)}
+        pivot_index = [index[pivot] for pivot in pivots]
+        # d(pivot, node) and d(node, pivot)
+        from_pivots = cls.calculate_pivot_distances(graph, pivots)
+        to_pivots = cls.calculate_pivot_distances(
+            graph.reverse(copy=False), pivots
+        )
+
+        # eccentricity bounds, exact at the pivots
+        pivot_eccentricity = from_pivots.max(axis=1)
+        lower = to_pivots.max(axis=0)
+        upper = (to_pivots + pivot_eccentricity[:, None]).min(axis=0)
+        lower[pivot_index] = upper[pivot_index] = pivot_eccentricity
+        diameter = int(lower.max())
+
+        # mean distance to and from every node over the other pivots
+        not_pivot = np.ones(len(graph))
+        not_pivot[pivot_index] = 0
+        num_others = num_samples - 1 + not_pivot
+        incoming = from_pivots.sum(axis=0) / num_others
+        outgoing = to_pivots.astype(float)
+        outgoing[np.arange(num_samples), pivot_index] = np.nan
+        closeness = 1 / incoming
+        independence = 1 - np.nanmean(outgoing, axis=0) / diameter
+
+        # a mean distance within epsilon of the estimate, and at least 1
+        epsilon = cls.hoeffding_bound(upper.max(), num_samples, confidence)
+        closeness_bound = np.maximum(
+            1 / np.maximum(incoming - epsilon, 1) - closeness,
+            closeness - 1 / (incoming + epsilon),
+        ).max()
+
+        return {
+            "betweenness_centrality": betweenness,
+            "edge_betweenness_centrality": edge_betweenness,
+            "closeness_centrality": dict(zip(graph, closeness.tolist())),
+            "eccentricity": dict(zip(graph, lower.tolist())),
+            "diameter": diameter,
+            "radius": int(lower.min()),
+            "node_independence": dict(zip(graph, independence.tolist())),
+            "second_order_centrality": dict(
+                zip(graph, np.nanstd(outgoing, axis=0).tolist())
+            ),
+            "error_bounds": {
+                # the pivots themselves are averaged over one sample less
+                "betweenness_centrality": cls.hoeffding_bound(
+                    1, num_samples - 1, confidence
+                ),
+                "edge_betweenness_centrality": cls.hoeffding_bound(
+                    1, num_samples, confidence
+                ),
+                "closeness_centrality": float(closeness_bound),
+                "eccentricity": int((upper - lower).max()),
+                "diameter": int(upper.max()) - diameter,
+                "radius": int(upper.min() - lower.min()),
+                "node_independence": cls.hoeffding_bound(
+                    1, num_samples - 1, confidence
+                ),
+                "second_order_centrality": float("nan"),
+            },
+        }
+
     @classmethod
-    def calculate_features(cls, graph_data: GraphData) -> GraphFeatures:
+    def calculate_features(
+        cls,
+        graph_data: GraphData,
+        mode: str = "exact",
+        num_samples: int = 100,
+        seed: Optional[int] = None,
+        confidence: float = 0.95,
+    ) -> GraphFeatures:
+        """
+        param mode: "exact", or "approximate" to estimate betweenness, edge
+        betweenness and the path length based features from num_samples
+        pivots drawn with seed, see calculate_approximate_path_features;
+        graphs of at most num_samples nodes are always exact
+        param confidence: confidence level of the approximate error bounds
+        """
+        if mode not in FEATURE_MODES:
+            raise ValueError(
+                f"Invalid feature mode {mode}, expected one of "
+                f"{FEATURE_MODES}"
+            )
+        if num_samples < 2:
+            raise ValueError(
+                f"Invalid number of samples {num_samples}, expected at "
+                "least 2"
+            )
         G = graph_data.graph
+        if mode == "approximate" and num_samples < len(G):
+            path_features = cls.calculate_approximate_path_features(
+                G, num_samples, seed, confidence
+            )
+            path_features.update(num_samples=num_samples, seed=seed)
+        else:
+            mode = "exact"
+            path_features = cls.calculate_exact_path_features(G)
         degree_centrality = nx.degree_centrality(G)  # Degree centrality
-        betweenness_centrality = nx.betweenness_centrality(
-            G
-        )  # Betweenness centrality
-        closeness_centrality = nx.closeness_centrality(
-            G
-        )  # Closeness centrality
-        edge_betweenness_centrality = nx.edge_betweenness_centrality(
-            G
-        )  # edge betweenness centrality
-        eccentricity = nx.eccentricity(G)  # Eccentricity
-        diameter = nx.diameter(G)
-        radius = nx.radius(G)
-        node_independence = cls.calculate_node_independence(
-            G
-        )  # node independence
-        second_order_centrality = cls.calculate_second_order_centrality(
-            G
-        )  # second order centrality
         clustering_coefficient = nx.clustering(G)
 
         average_dc = cls.calculate_average_centrality(degree_centrality)
-        average_bc = cls.calculate_average_centrality(betweenness_centrality)
-        average_cc = cls.calculate_average_centrality(closeness_centrality)
-        average_soc = cls.calculate_average_centrality(second_order_centrality)
-        average_ni = cls.calculate_average_centrality(node_independence)
+        average_bc = cls.calculate_average_centrality(
+            path_features["betweenness_centrality"]
+        )
+        average_cc = cls.calculate_average_centrality(
+            path_features["closeness_centrality"]
+        )
+        average_soc = cls.calculate_average_centrality(
+            path_features["second_order_centrality"]
+        )
+        average_ni = cls.calculate_average_centrality(
+            path_features["node_independence"]
+        )
         average_clu_co = cls.calculate_average_centrality(
             clustering_coefficient
         )
@@ -82,14 +331,6 @@ class AgentFeatures:
         g_features = GraphFeatures(
             id=graph_data.id,
             degree_centrality=degree_centrality,
-            betweenness_centrality=betweenness_centrality,
-            closeness_centrality=closeness_centrality,
-            edge_betweenness_centrality=edge_betweenness_centrality,
-            eccentricity=eccentricity,
-            diameter=diameter,
-            radius=radius,
-            node_independence=node_independence,
-            second_order_centrality=second_order_centrality,
             clustering_coefficient=clustering_coefficient,
             average_betweenness_centrality=average_bc,
             average_closeness_centrality=average_cc,
@@ -97,6 +338,8 @@ class AgentFeatures:
             average_node_independence=average_ni,
             average_second_order_centrality=average_soc,
             average_clustering_coefficient=average_clu_co,
+            mode=mode,
+            **path_features,
         )
 
         return g_features
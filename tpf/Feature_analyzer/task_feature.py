@@ -1,5 +1,3 @@
-from typing import Dict
-
 import networkx as nx
 import numpy as np
 from interface import GraphData, TaskGraphFeatures
@@ -41,29 +39,62 @@ class TaskFeatures:
         return mutual_info
 
     @classmethod
-    def calculate_path_length_entropy(cls, graph: nx.DiGraph) -> float:
-        path_length_prob: Dict[int, float] = {}
-        for node in range(len(graph)):
-            if node == 0:
-                continue
-            else:
-                paths = nx.all_simple_paths(graph, source=node, target=0)
-                for path in paths:
-                    path_length = len(path) - 1
+    def calculate_path_length_distribution(
+        cls, graph: nx.DiGraph, target=0
+    ) -> np.ndarray:
+        """
+        Entry l is the sum, over the paths of l edges from every other node
+        to target, of the product of their edge weights.
+
+        On a DAG the paths of a node are its edges followed by the paths of
+        their heads, so in reverse topological order every node gets its
+        length -> weight vector from its successors' vectors: O(edges x
+        longest path) instead of enumerating the paths, which grow
+        exponentially. Graphs with cycles fall back to the enumeration of
+        the simple paths.
+        """
+        distribution = np.zeros(len(graph))
+        if not nx.is_directed_acyclic_graph(graph):
+            for node in graph:
+                if node == target:
+                    continue
+                for path in nx.all_simple_paths(graph, node, target):
                     prob = 1.0
-                    for i in range(len(path) - 1):
-                        prob *= graph[path[i]][path[i + 1]]["weight"]
-                    if path_length in path_length_prob:
-                        path_length_prob[path_length] += prob
-                    else:
-                        path_length_prob[path_length] = prob
-        total_prob = sum(path_length_prob.values())
-        for key in path_length_prob:
-            path_length_prob[key] /= total_prob
-        path_entropy = 0.0
-        for prob in path_length_prob.values():
-            path_entropy -= prob * np.log(prob)
-        return path_entropy
+                    for u, v in zip(path[:-1], path[1:]):
+                        prob *= graph[u][v]["weight"]
+                    distribution[len(path) - 1] += prob
+            return distribution
+
+        paths = {target: np.ones(1)}  # by node, while a predecessor needs it
+        unvisited_predecessors = dict(graph.in_degree())
+        for node in reversed(list(nx.topological_sort(graph))):
+            if node == target:
+                continue
+            heads = [head for head in graph.successors(node) if head in paths]
+            if heads:
+                node_paths = np.zeros(1 + max(len(paths[h]) for h in heads))
+                for head in heads:
+                    node_paths[slice(1, len(paths[head]) + 1)] += (
+                        graph[node][head]["weight"] * paths[head]
+                    )
+                distribution[slice(0, len(node_paths))] += node_paths
+                paths[node] = node_paths
+            for head in graph.successors(node):
+                unvisited_predecessors[head] -= 1
+                if unvisited_predecessors[head] == 0 and head != target:
+                    paths.pop(head, None)
+        return distribution
+
+    @classmethod
+    def calculate_path_length_entropy(cls, graph: nx.DiGraph) -> float:
+        # entropy of the lengths of the paths to the sink 0, weighted by
+        # the product of their edge weights
+        distribution = cls.calculate_path_length_distribution(graph)
+        weights = distribution[distribution != 0]
+        if len(weights) == 0:
+            return 0.0
+        prob = weights / weights.sum()
+        return 0.0 - np.sum(prob * np.log(prob))
 
     @classmethod
     def calculate_features(cls, graph_data: GraphData) -> TaskGraphFeatures:
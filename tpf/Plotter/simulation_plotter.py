@@ -1,19 +1,46 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+# groups of the default run_simulation, in report order
+COLORS = ["b", "g", "r", "c", "m", "y"]
+LABELS = [
+    "No Topology",
+    "Mesh Topology(10%)",
+    "Mesh Topology(50%)",
+    "Mesh Topology(90%)",
+    "Star Topology",
+    "Chain Topology",
+]
 
-def plot_hits(num_steps, *cumulative_hits_over_time, save_path):
+
+def group_styles(num_groups, labels=None):
+    """
+    param labels: labels of the groups, e.g. handle.summary["group_labels"]
+    of run_simulation; the default groups if None
+
+    Return the colors and labels of num_groups groups
+    """
+    if labels is None:
+        labels = (
+            LABELS
+            if num_groups == len(LABELS)
+            else [f"Group {i}" for i in range(num_groups)]
+        )
+    colors = (
+        COLORS
+        if num_groups <= len(COLORS)
+        else sns.color_palette("husl", num_groups)
+    )
+    return colors, labels
+
+
+def plot_hits(num_steps, *cumulative_hits_over_time, save_path, labels=None):
+    """
+    param labels: labels of the groups, see group_styles
+    """
     sns.set_theme(style="whitegrid")
 
-    colors = ["b", "g", "r", "c", "m", "y"]
-    labels = [
-        "No Topology",
-        "Mesh Topology(10%)",
-        "Mesh Topology(50%)",
-        "Mesh Topology(90%)",
-        "Star Topology",
-        "Chain Topology",
-    ]
+    colors, labels = group_styles(len(cumulative_hits_over_time), labels)
 
     for hits, color, label in zip(cumulative_hits_over_time, colors, labels):
         plt.plot(
@@ -37,24 +64,17 @@ def plot_hits(num_steps, *cumulative_hits_over_time, save_path):
     plt.close()
 
 
-def plot_max_hits(agent_counts_list, max_hits_list, save_path):
+def plot_max_hits(agent_counts_list, max_hits_list, save_path, labels=None):
     """
     param agent_counts_list: list of agent counts
     param max_hits_list: list of tuples of max hits in each group
     param save_path: path to save the plot
+    param labels: labels of the groups, see group_styles
     """
 
     sns.set_theme(style="whitegrid")
 
-    colors = ["b", "g", "r", "c", "m", "y"]
-    labels = [
-        "No Topology",
-        "Mesh Topology(10%)",
-        "Mesh Topology(50%)",
-        "Mesh Topology(90%)",
-        "Star Topology",
-        "Chain Topology",
-    ]
+    colors, labels = group_styles(len(max_hits_list[0]), labels)
 
     # range is the length of each tuple in the max_hits_list
     for i in range(len(max_hits_list[0])):
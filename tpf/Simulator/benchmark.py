@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import platform
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from Agent_simulator.agent import _Agent
+from Agent_simulator.update_strategy import Para_update_strategies as Opinion
+from Env_simulator.env import Env
+from Simulator.game import run_simulation
+from Simulator.profiler import StepProfiler
+from utils import calculate_hits
+
+# environment of the benchmarks, as in simulate_exp
+ENV_PARAMS = {
+    "width": 80,
+    "height": 60,
+    "radius": 2,
+    "initial_boundary_width": 10,
+    "velocity": 1,
+    "expansion_times": 5,
+}
+
+
+def create_env(rng: np.random.Generator) -> Env:
+    return Env(
+        ENV_PARAMS["width"],
+        ENV_PARAMS["height"],
+        ENV_PARAMS["radius"],
+        ENV_PARAMS["velocity"],
+        ENV_PARAMS["initial_boundary_width"],
+        ENV_PARAMS["expansion_times"],
+        rng=rng,
+    )
+
+
+def create_agents(env: Env, n: int, rng: np.random.Generator):
+    return [_Agent.create(i, env.get_boundary(), rng) for i in range(n)]
+
+
+def create_omega_matrix(n: int) -> np.ndarray:
+    omega_matrix = np.ones((n, n))
+    np.fill_diagonal(omega_matrix, 0)
+    return omega_matrix
+
+
+def setup_agent_move(n: int, rng: np.random.Generator) -> Callable:
+    # one step of _Agent.move over n agents
+    agents = create_agents(create_env(rng), n, rng)
+
+    def agent_move():
+        for agent in agents:
+            _Agent.move(agent, 1)
+
+    return agent_move
+
+
+def setup_update_omega_matrix(n: int, rng: np.random.Generator) -> Callable:
+    # one omega update of an n x n matrix, a tenth of the agents hit
+    omega_matrix = create_omega_matrix(n)
+    hits_info = dict.fromkeys(
+        rng.choice(n, max(1, n // 10), replace=False).tolist()
+    )
+    return lambda: _Agent.update_omega_matrix(omega_matrix, hits_info)
+
+
+def setup_fj_update_parameters(n: int, rng: np.random.Generator) -> Callable:
+    # one FJ_update_parameters call for one agent of a group of n
+    agents = create_agents(create_env(rng), n, rng)
+    omega_matrix = create_omega_matrix(n)
+    temp_matrix = (rng.random((n, n)) < 0.5).astype(float)
+    return lambda: Opinion.FJ_update_parameters(
+        agents[0], n, omega_matrix, agents, temp_matrix, rng
+    )
+
+
+def setup_calculate_hits(n: int, rng: np.random.Generator) -> Callable:
+    # hits of n agents in the hole
+    env = create_env(rng)
+    agents = create_agents(env, n, rng)
+    target_hole = env.get_target_hole()
+    return lambda: calculate_hits(agents, target_hole)
+
+
+def setup_update_state_transition_matrix(
+    n: int, rng: np.random.Generator
+) -> Callable:
+    # n hole moves recorded in the transition counts
+    env = create_env(rng)
+    x = rng.uniform(-ENV_PARAMS["width"] / 2, ENV_PARAMS["width"] / 2, n + 1)
+    y = rng.uniform(-ENV_PARAMS["height"] / 2, ENV_PARAMS["height"] / 2, n + 1)
+    moves = list(zip(x[:-1], y[:-1], x[1:], y[1:]))
+
+    def update_state_transition_matrix():
+        for move in moves:
+            env.update_state_transition_matrix(*move)
+
+    return update_state_transition_matrix
+
+
+# name: (swept size, setup(size, rng) returning the call to time)
+BENCHMARKS = {
+    "agent_move": ("num_agents", setup_agent_move),
+    "update_omega_matrix": ("num_agents", setup_update_omega_matrix),
+    "FJ_update_parameters": ("num_agents", setup_fj_update_parameters),
+    "calculate_hits": ("num_agents", setup_calculate_hits),
+    "update_state_transition_matrix": (
+        "num_steps",
+        setup_update_state_transition_matrix,
+    ),
+}
+
+
+def time_call(fn: Callable, repeats: int = 5) -> float:
+    """
+    Best time of one call of fn over repeats rounds; every round runs fn
+    as often as needed to take at least 0.2 s, as timeit does
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeats, number)) / number
+
+
+def time_run_simulation(
+    params: Dict[str, Any], repeats: int = 1
+) -> Dict[str, float]:
+    """
+    Wall time of run_simulation with params and the time of its step loop
+    alone, measured by StepProfiler (without setup, plots and saved
+    files); best of repeats
+    """
+    seconds, loop_seconds = [], []
+    for _ in range(repeats):
+        profiler = StepProfiler()
+        start = timeit.default_timer()
+        run_simulation(profiler=profiler, **params)
+        seconds.append(timeit.default_timer() - start)
+        loop_seconds.append(profiler.report()["total_ns"] / 1e9)
+    return {"seconds": min(seconds), "loop_seconds": min(loop_seconds)}
+
+
+def fit_exponent(sizes: List[int], seconds: List[float]) -> float:
+    """
+    Slope of log(seconds) over log(size) on the larger half of the sizes,
+    where fixed costs no longer hide the growth: the time grows as
+    size^exponent
+    """
+    if len(sizes) < 2:
+        return float("nan")
+    order = np.argsort(sizes)
+    upper = order[slice(min(len(sizes) // 2, len(sizes) - 2), None)]
+    slope, _ = np.polyfit(
+        np.log(np.asarray(sizes)[upper]),
+        np.log(np.asarray(seconds)[upper]),
+        1,
+    )
+    return float(slope)
+
+
+def run_benchmarks(
+    sizes: Dict[str, List[int]],
+    simulation_sizes: Optional[Dict[str, List[int]]] = None,
+    simulation_params: Optional[Dict[str, Any]] = None,
+    seed: int = 2024,
+    repeats: int = 5,
+) -> Dict[str, Any]:
+    """
+    param sizes: sizes every benchmark of BENCHMARKS is run with, by name
+    param simulation_sizes: values of the run_simulation arguments to
+    sweep, e.g. {"num_agents": [10, 100], "num_steps": [50, 100]}; one
+    benchmark run_simulation_<argument> per entry, the other arguments
+    from simulation_params
+    param seed: every size starts from default_rng(seed)
+
+    Return the results: seconds per call at every size and the fitted
+    scaling exponent of every benchmark
+    """
+    results = {
+        "meta": {
+            "seed": seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "benchmarks": {},
+    }
+    for name, benchmark_sizes in sizes.items():
+        parameter, setup = BENCHMARKS[name]
+        seconds = []
+        for size in benchmark_sizes:
+            fn = setup(size, np.random.default_rng(seed))
+            seconds.append(time_call(fn, repeats))
+            logging.info(f"{name} {parameter}={size}: {seconds[-1]:.3g} s")
+        results["benchmarks"][name] = {
+            "parameter": parameter,
+            "sizes": list(benchmark_sizes),
+            "seconds": seconds,
+            "exponent": fit_exponent(benchmark_sizes, seconds),
+        }
+
+    for parameter, benchmark_sizes in (simulation_sizes or {}).items():
+        name = f"run_simulation_{parameter}"
+        timings = [
+            time_run_simulation(
+                {**simulation_params, parameter: size, "seed": seed}, repeats
+            )
+            for size in benchmark_sizes
+        ]
+        seconds = [timing["loop_seconds"] for timing in timings]
+        for size, timing in zip(benchmark_sizes, timings):
+            logging.info(
+                f"{name} {parameter}={size}: {timing['seconds']:.3g} s, "
+                f"step loop {timing['loop_seconds']:.3g} s"
+            )
+        results["benchmarks"][name] = {
+            "parameter": parameter,
+            "sizes": list(benchmark_sizes),
+            "seconds": seconds,
+            "wall_seconds": [timing["seconds"] for timing in timings],
+            "exponent": fit_exponent(benchmark_sizes, seconds),
+        }
+    return results
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    time_tolerance: float = 0.3,
+    exponent_tolerance: float = 0.15,
+) -> List[str]:
+    """
+    param time_tolerance: allowed relative slowdown at any size
+    param exponent_tolerance: allowed increase of a scaling exponent
+
+    Return the regressions against baseline, one message each; sizes and
+    benchmarks missing from either side are skipped
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        reference = baseline["benchmarks"][name]
+        reference_seconds = dict(zip(reference["sizes"], reference["seconds"]))
+        for size, seconds in zip(result["sizes"], result["seconds"]):
+            if size not in reference_seconds:
+                continue
+            ratio = seconds / reference_seconds[size]
+            if ratio > 1 + time_tolerance:
+                regressions.append(
+                    f"{name} {result['parameter']}={size}: "
+                    f"{seconds:.3g} s, {ratio:.2f}x the baseline"
+                )
+        if result["exponent"] > reference["exponent"] + exponent_tolerance:
+            regressions.append(
+                f"{name}: scales as {result['parameter']}^"
+                f"{result['exponent']:.2f}, baseline "
+                f"^{reference['exponent']:.2f}"
+            )
+    return regressions
@@ -0,0 +1,132 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from Env_simulator.env import Env
+from interface import ContiAgentArray
+from Simulator.convergence import EarlyStopping
+from Simulator.metrics import MetricsSink
+
+ENV_KEYS = [
+    "hole",
+    "targets",
+    "boundary",
+    "transition_rows",
+    "transition_cols",
+    "transition_counts",
+]
+
+
+def save_checkpoint(
+    path: str,
+    step: int,
+    agents: ContiAgentArray,
+    omega_matrices: List[np.ndarray],
+    env: Env,
+    agent_hits: np.ndarray,
+    total_hits: np.ndarray,
+    metrics: MetricsSink,
+    rng: np.random.Generator,
+    early_stopping: Optional[EarlyStopping] = None,
+    target_hits: Optional[np.ndarray] = None,
+) -> None:
+    """
+    param path: .npz file of the checkpoint
+    param step: number of completed steps
+    param target_hits: (target, group) hits of every target
+
+    Saves the state of run_vector_simulation after `step` steps as plain
+    arrays in an .npz file. The file is written next to `path` and moved
+    into place, so an interrupted write never leaves a broken checkpoint.
+    The metrics are flushed first; the series of a sink that does not
+    keep them on disk are copied into the checkpoint.
+    """
+    metrics.flush()
+    arrays = {
+        "step": np.array(step),
+        "agent_id": agents.id,
+        "agent_group": agents.group,
+        "position": agents.position,
+        "direction": agents.direction,
+        "speed": agents.speed,
+        # dense matrices, or edge weights of fixed topologies, flattened
+        "omega_matrices": np.concatenate(
+            [omega_matrix.ravel() for omega_matrix in omega_matrices]
+        ),
+        "omega_shapes": np.array(
+            [omega_matrix.shape for omega_matrix in omega_matrices]
+        ),
+        "agent_hits": agent_hits,
+        "total_hits": total_hits,
+        # the bit generator state holds 128-bit integers, keep it as JSON
+        "rng_state": np.array(json.dumps(rng.bit_generator.state)),
+    }
+    arrays.update(env.get_state())
+    if early_stopping is not None:
+        arrays.update(early_stopping.get_state())
+    if target_hits is not None:
+        arrays["target_hits"] = target_hits
+    if not metrics.persistent:
+        arrays.update(
+            {"metrics_" + name: metrics.read(name) for name in metrics.names}
+        )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> dict:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def load_omega_matrices(checkpoint: dict) -> List[np.ndarray]:
+    shapes = [tuple(shape) for shape in checkpoint["omega_shapes"]]
+    sizes = [int(np.prod(shape)) for shape in shapes]
+    return [
+        values.reshape(shape)
+        for values, shape in zip(
+            np.split(checkpoint["omega_matrices"], np.cumsum(sizes)[:-1]),
+            shapes,
+        )
+    ]
+
+
+def restore_checkpoint(
+    checkpoint: dict,
+    agents: ContiAgentArray,
+    env: Env,
+    metrics: MetricsSink,
+    rng: np.random.Generator,
+    early_stopping: Optional[EarlyStopping] = None,
+) -> None:
+    """
+    Restores agents, Env, the metrics, the random generator and the early
+    stopping state in place; metrics must already be opened at the
+    checkpointed step
+    """
+    if checkpoint["position"].shape != agents.position.shape:
+        raise ValueError(
+            "Checkpoint does not match the simulation: "
+            f"{len(checkpoint['position'])} agents saved, "
+            f"{len(agents.position)} expected"
+        )
+    env.set_state({key: checkpoint[key] for key in ENV_KEYS})
+    agents.id = checkpoint["agent_id"]
+    agents.group = checkpoint["agent_group"]
+    agents.position = checkpoint["position"]
+    agents.direction = checkpoint["direction"]
+    agents.speed = checkpoint["speed"]
+    agents.boundary = env.get_boundary()
+    rng.bit_generator.state = json.loads(str(checkpoint["rng_state"]))
+    for name in metrics.names:
+        if "metrics_" + name in checkpoint:
+            metrics.write_rows(0, **{name: checkpoint["metrics_" + name]})
+    if early_stopping is not None and "early_stopping_steps" in checkpoint:
+        early_stopping.set_state(checkpoint)
@@ -0,0 +1,127 @@
+import logging
+from collections import deque
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class EarlyStopping:
+    """
+    Opt-in convergence test on changes_per_step. A run counts as converged
+    once the mean change over the last `window` steps has stayed below
+    `threshold` for `patience` consecutive steps; converged_step is the
+    number of steps run with the full dynamics.
+
+    param mode: what happens to the remaining steps
+        "frozen": omega matrices and agent speeds are frozen, the FJ and
+        omega updates are skipped; agents and hole still move and hits
+        are still counted
+        "extrapolate": the run stops and the cumulative hits are
+        extrapolated, see extrapolate_hits
+    """
+
+    modes = ("frozen", "extrapolate")
+
+    def __init__(
+        self,
+        threshold: float,
+        window: int = 50,
+        patience: int = 20,
+        mode: str = "frozen",
+    ):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown early stopping mode: {mode}")
+        if window < 2 or patience < 1:
+            raise ValueError("Early stopping needs window >= 2, patience >= 1")
+        self.threshold = threshold
+        self.window = window
+        self.patience = patience
+        self.mode = mode
+        self.reset()
+
+    def reset(self) -> None:
+        self.converged_step: Optional[int] = None
+        self.steps_below = 0
+        self._changes = deque(maxlen=self.window)
+        self.cumulative_hits = np.zeros(0)
+
+    @property
+    def converged(self) -> bool:
+        return self.converged_step is not None
+
+    @property
+    def moving_average(self) -> float:
+        return float(np.mean(self._changes)) if self._changes else np.inf
+
+    def update(self, step: int, change: float, cumulative_hits) -> bool:
+        """
+        param step: step that just finished
+        param change: changes_per_step of that step
+        param cumulative_hits: cumulative hits per group after that step
+
+        Return True once the run has converged
+        """
+        if self.converged:
+            return True
+        self._changes.append(change)
+        self.cumulative_hits = np.array(cumulative_hits, dtype=float)
+        if len(self._changes) < self.window:
+            return False
+        if self.moving_average < self.threshold:
+            self.steps_below += 1
+        else:
+            self.steps_below = 0
+        if self.steps_below >= self.patience:
+            self.converged_step = step + 1
+            logging.info(
+                f"Converged after {self.converged_step} steps, moving "
+                f"average change {self.moving_average:.3g}"
+            )
+        return self.converged
+
+    def extrapolate_hits(
+        self, num_steps: int, expansion_factor: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        param num_steps: number of steps of the run
+        param expansion_factor: boundary scale factor per step
+
+        Hole and agents move inside the same expanding square, so the hit
+        rate of a group falls with the area of the boundary. The hits per
+        step and unit of 1 / area are estimated from all steps before
+        convergence (hits come in bursts, a window is too short) and
+        carried over to the remaining steps.
+
+        Return the cumulative hits (remaining steps, group) and the
+        changes per step, held at the final moving average
+        """
+        # relative 1 / area of the boundary at every step
+        inverse_area = expansion_factor ** (-2.0 * np.arange(num_steps))
+        before, after = np.split(inverse_area, [self.converged_step])
+        rate = self.cumulative_hits / before.sum()
+        hits = self.cumulative_hits + np.cumsum(
+            after[:, np.newaxis] * rate, axis=0
+        )
+        changes = np.full(len(after), self.moving_average)
+        return np.rint(hits).astype(np.int64), changes
+
+    def get_state(self) -> dict:
+        # plain arrays for checkpoints, see set_state
+        return {
+            "early_stopping_changes": np.array(self._changes, dtype=float),
+            "early_stopping_hits": self.cumulative_hits,
+            "early_stopping_steps": np.array(
+                [
+                    self.steps_below,
+                    -1 if self.converged_step is None else self.converged_step,
+                ]
+            ),
+        }
+
+    def set_state(self, state: dict) -> None:
+        self.reset()
+        self._changes.extend(state["early_stopping_changes"].tolist())
+        self.cumulative_hits = state["early_stopping_hits"]
+        steps_below, converged_step = state["early_stopping_steps"].tolist()
+        self.steps_below = steps_below
+        self.converged_step = None if converged_step < 0 else converged_step
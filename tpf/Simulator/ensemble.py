@@ -0,0 +1,178 @@
+import numpy as np
+from Agent_simulator.agent import _Agent, _AgentArray
+from Agent_simulator.topology import TopologyProvider
+from Agent_simulator.update_strategy import Para_update_strategies as Opinion
+from Env_simulator.env import Env
+from interface import EnsembleResult
+from shapely.geometry import Point
+from utils import calculate_hits_in_circle
+
+
+def summarize_ensemble(
+    cumulative_hits, max_hits, changes_per_step, quantiles
+) -> EnsembleResult:
+    quantiles = np.asarray(quantiles, dtype=float)
+    return EnsembleResult(
+        quantiles=quantiles,
+        cumulative_hits=cumulative_hits,
+        max_hits=max_hits,
+        changes_per_step=changes_per_step,
+        mean_cumulative_hits=cumulative_hits.mean(axis=0),
+        std_cumulative_hits=cumulative_hits.std(axis=0),
+        quantile_cumulative_hits=np.quantile(
+            cumulative_hits, quantiles, axis=0
+        ),
+        mean_max_hits=max_hits.mean(axis=0),
+        std_max_hits=max_hits.std(axis=0),
+        quantile_max_hits=np.quantile(max_hits, quantiles, axis=0),
+    )
+
+
+def run_ensemble_simulation(
+    width,
+    height,
+    radius,
+    initial_boundary_width,
+    velocity,
+    num_agents,
+    dt,
+    num_steps,
+    expansion_times,
+    num_replicas,
+    quantiles=(0.05, 0.5, 0.95),
+    seed=None,
+) -> EnsembleResult:
+    """
+    param num_replicas: number of independent replicas
+    param quantiles: quantiles of the aggregate curves
+    param seed: int, SeedSequence or Generator shared by all replicas
+
+    Runs num_replicas independent copies of run_simulation in lockstep.
+    Agent arrays get a replica dimension (group, replica, agent, laid out
+    flat), every replica has its own Env, and the topologies of all
+    replicas are sampled as one block-diagonal edge list. Nothing is
+    plotted or saved.
+
+    A standalone API, not an engine of run_simulation nor a sweep worker:
+    it always runs the six default groups and returns an EnsembleResult
+    rather than a MetricsHandle; ensemble_exp.py drives it. The omega
+    matrices are only updated with the hits of the first dynamic group,
+    masked on purpose: run_simulation keys hits_info by agent id, which
+    update_omega_matrix only matches for that group, and the replicas
+    must sample the same model.
+    """
+    rng = np.random.default_rng(seed)
+
+    # create one environment per replica, their boundaries expand
+    # identically so the agents share the first one
+    envs = [
+        Env(
+            width,
+            height,
+            radius,
+            velocity,
+            initial_boundary_width,
+            expansion_times,
+            rng=rng,
+        )
+        for _ in range(num_replicas)
+    ]
+
+    # initialize variables
+    num_dynamic_groups = 5
+    num_groups = num_dynamic_groups + 1
+    link_percentage_list = [0.1, 0.5, 0.9]  # 0.1, 0.3, 0.5, 0.7, 0.9
+    block_size = num_replicas * num_agents
+
+    omega_matrices = np.ones(
+        (num_dynamic_groups, num_replicas, num_agents, num_agents)
+    )
+    np.einsum("...ii->...i", omega_matrices)[...] = 0
+
+    topology = TopologyProvider(num_agents, link_percentage_list, rng)
+    expansion_factor = expansion_times ** (1 / num_steps)
+    changes_per_step = np.zeros((num_replicas, num_steps))
+
+    # create agents: row g * block_size + r * num_agents + i is agent i of
+    # replica r in group g, groups 0-4 are dynamic and group 5 is static
+    agents = _AgentArray.create(
+        block_size, num_groups, envs[0].get_boundary(), rng
+    )
+    replica = np.arange(len(agents.id)) % block_size // num_agents
+    groups = [
+        slice(i * block_size, (i + 1) * block_size) for i in range(num_groups)
+    ]
+    report_order = [num_dynamic_groups] + list(range(num_dynamic_groups))
+
+    cumulative_hits = np.zeros(
+        (num_replicas, num_groups, num_steps), dtype=int
+    )
+    agent_hits = np.zeros(len(agents.id), dtype=int)
+    total_hits = np.zeros((num_groups, num_replicas), dtype=int)
+
+    # start simulation
+    for step in range(num_steps):
+        # expand polygons and move the agents
+        for env in envs:
+            env.expand_boundary(expansion_factor)
+        _AgentArray.update_boundary(agents, envs[0].get_boundary(), rng)
+        _AgentArray.move(agents, dt)
+
+        # calculate hits against the hole of every agent's replica
+        centers = np.array([[env.hole_x, env.hole_y] for env in envs])
+        hit_mask, hit_counts = calculate_hits_in_circle(
+            agents.position,
+            centers[replica],
+            radius,
+            agents.group * num_replicas + replica,
+            num_groups * num_replicas,
+        )
+        agent_hits += hit_mask
+        total_hits += hit_counts.reshape(num_groups, num_replicas)
+        cumulative_hits[:, :, step] = total_hits[report_order].T
+
+        # move the holes
+        for env in envs:
+            old_position = Point(env.hole_x, env.hole_y)
+            new_position = env.move_hole(dt)
+            env.update_state_transition_matrix(
+                old_position.x, old_position.y, new_position.x, new_position.y
+            )
+
+        # update agents of every replica with their omega matrices
+        temp_matrix_list = topology.sample(num_replicas)
+        for i, adjacency in enumerate(temp_matrix_list):
+            rows, cols = adjacency.rows, adjacency.cols
+            Opinion.FJ_update_edge_list(
+                agents.position[groups[i]],
+                agents.speed[groups[i]],
+                agents.boundary,
+                rows,
+                cols,
+                omega_matrices[i][
+                    rows // num_agents, rows % num_agents, cols % num_agents
+                ],
+                rng,
+            )
+
+        # run_simulation keys hits_info by agent id, which
+        # update_omega_matrix only matches for the first dynamic group;
+        # do the same so the replicas sample the same model
+        omega_hit = hit_mask[: num_dynamic_groups * block_size].reshape(
+            num_dynamic_groups, num_replicas, num_agents
+        )
+        omega_hit = (
+            omega_hit
+            & (np.arange(num_dynamic_groups) == 0)[:, np.newaxis, np.newaxis]
+        )
+        changes = _Agent.update_omega_matrices(omega_matrices, omega_hit)
+        changes_per_step[:, step] = changes.mean(axis=0)
+
+    max_hits = (
+        agent_hits.reshape(num_groups, num_replicas, num_agents)
+        .max(axis=2)[report_order]
+        .T
+    )
+    return summarize_ensemble(
+        cumulative_hits, max_hits, changes_per_step, quantiles
+    )
@@ -1,13 +1,31 @@
 import logging
-from typing import List, Tuple
+import os
+from itertools import compress
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
-from Agent_simulator.agent import _Agent  # Agent
+from Agent_simulator.agent import _Agent, _AgentArray  # Agent
+from Agent_simulator.topology import (
+    FixedTopologyProvider,
+    Topology,
+    TopologyProvider,
+)
 from Agent_simulator.update_strategy import Para_update_strategies as Opinion
 from Env_simulator.env import Env
+from Env_simulator.spatial_hash import SpatialHashGrid
+from interface import ContiAgentArray
 from Plotter.simulation_plotter import plot_convergence
-from shapely.geometry import Point
-from utils import calculate_hits
+from Simulator.checkpoint import (
+    load_checkpoint,
+    load_omega_matrices,
+    restore_checkpoint,
+    save_checkpoint,
+)
+from Simulator.convergence import EarlyStopping
+from Simulator.metrics import MemoryMetricsSink, MetricsSink, load_metrics
+from Simulator.profiler import NullProfiler, StepProfiler
+from Simulator.trajectory import TrajectoryRecorder
+from utils import calculate_target_hits
 
 logging.basicConfig(level=logging.INFO)
 
@@ -23,18 +41,255 @@ def update_agents(
     omega_matrix: np.ndarray,
     hits_info: List[dict],
     temp_matrix: np.ndarray,
+    rng: Optional[np.random.Generator] = None,
 ) -> Tuple[float, np.ndarray]:
-    for agent in agents:
-        # Opinion.FJ_update_parameters_adapt(
-        #     agent, len_agents, omega_matrix, agents, temp_matrix
-        # )
-        Opinion.FJ_update_parameters(
-            agent, len_agents, omega_matrix, agents, temp_matrix
-        )
-    change_in_this_step, omega_matrix = _Agent.update_omega_matrix(
-        omega_matrix, hits_info
+    # for agent in agents:
+    #     Opinion.FJ_update_parameters_adapt(
+    #         agent, len_agents, omega_matrix, agents, temp_matrix
+    #     )
+    Opinion.FJ_update_group(agents, omega_matrix, temp_matrix, rng)
+    return update_omega(omega_matrix, hits_info, temp_matrix)
+
+
+def update_agent_arrays(
+    agents: ContiAgentArray,
+    group: slice,
+    omega_matrix: np.ndarray,
+    hits_info: dict,
+    temp_matrix: np.ndarray,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[float, np.ndarray]:
+    Opinion.FJ_update_group_array(
+        agents, group, omega_matrix, temp_matrix, rng
+    )
+    return update_omega(omega_matrix, hits_info, temp_matrix)
+
+
+def update_omega(
+    omega_matrix: np.ndarray, hits_info: dict, temp_matrix
+) -> Tuple[float, np.ndarray]:
+    # fixed sparse topologies keep the omega weights of their edges only
+    if omega_matrix.ndim == 1:
+        return _Agent.update_edge_weights(omega_matrix, temp_matrix, hits_info)
+    return _Agent.update_omega_matrix(omega_matrix, hits_info)
+
+
+def create_topologies(
+    num_agents,
+    link_percentage_list,
+    topologies: Optional[Sequence[Topology]] = None,
+    rng: Optional[np.random.Generator] = None,
+):
+    """
+    Return the topology provider of the dynamic groups, their initial
+    omega weights and their labels: by default one random mesh per link
+    percentage, a star and a ring, with dense omega matrices; with
+    topologies, one fixed sparse topology per group, with the omega
+    weights of its edges
+    """
+    if topologies is None:
+        provider = TopologyProvider(num_agents, link_percentage_list, rng)
+        omega_matrices = [
+            np.ones((num_agents, num_agents))
+            for _ in range(len(link_percentage_list) + 2)
+        ]
+        for omega_matrix in omega_matrices:
+            np.fill_diagonal(omega_matrix, 0)
+        labels = [
+            f"Mesh Topology({percentage:.0%})"
+            for percentage in link_percentage_list
+        ] + ["Star Topology", "Chain Topology"]
+        return provider, omega_matrices, labels
+
+    provider = FixedTopologyProvider(topologies)
+    for i, adjacency in enumerate(provider.adjacencies):
+        if adjacency.num_nodes != num_agents:
+            raise ValueError(
+                f"Topology {i} has {adjacency.num_nodes} agents, every "
+                f"group has num_agents={num_agents}"
+            )
+    omega_matrices = [
+        np.ones(len(adjacency.rows)) for adjacency in provider.adjacencies
+    ]
+    labels = [
+        FixedTopologyProvider.label(topology, i)
+        for i, topology in enumerate(topologies)
+    ]
+    return provider, omega_matrices, labels
+
+
+def count_groups(
+    link_percentage_list=(0.1, 0.5, 0.9),
+    topologies: Optional[Sequence[Topology]] = None,
+) -> int:
+    # groups of a run: the dynamic groups of create_topologies and the
+    # static group
+    if topologies is None:
+        return len(link_percentage_list) + 3
+    return len(topologies) + 1
+
+
+def save_simulation_results(env, run_name, num_steps, changes_per_step):
+    # plot the convergence graph with change per step
+    save_path = (
+        save_path_dict["simulation"] + "convergence" + f"_{run_name}.png"
+    )
+    plot_convergence(num_steps, changes_per_step, save_path)
+    logging.info(
+        f"Convergence plot saved at {save_path_dict['simulation']}convergence_"
+        f"{run_name}.png"
+    )
+
+    # save task matrix (CSR, scipy.sparse.load_npz compatible) and check
+    # its properties
+    data, _, indptr = env.get_state_transition_matrix()
+    assert data.size > 0
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    row_sums = np.bincount(rows, weights=data, minlength=len(indptr) - 1)
+    assert np.all(np.isclose(row_sums, 1) | (row_sums == 0))
+    env.state_transition_counts.save_npz(
+        save_path_dict["task_matrix"] + str(run_name) + ".npz"
+    )
+    logging.info(
+        f"Task matrix saved at {save_path_dict['task_matrix']}{run_name}.npz"
+    )
+
+
+def extrapolate_run(
+    early_stopping: EarlyStopping,
+    metrics: MetricsSink,
+    num_steps: int,
+    expansion_factor: float,
+    total_hits,
+    max_hits: List[int],
+) -> List[int]:
+    """
+    Fills the metrics of the steps after convergence with extrapolated
+    values and returns the max hits scaled like the total hits of their
+    group
+    """
+    hits, changes = early_stopping.extrapolate_hits(
+        num_steps, expansion_factor
+    )
+    metrics.flush()
+    if len(hits) == 0:
+        return max_hits
+    metrics.write_rows(
+        early_stopping.converged_step,
+        cumulative_hits=hits,
+        changes_per_step=changes,
+    )
+    total_hits = np.asarray(total_hits, dtype=float)
+    scale = np.divide(
+        hits[-1], total_hits, out=np.ones(len(hits[-1])), where=total_hits > 0
     )
-    return change_in_this_step, omega_matrix
+    return [int(round(m * f)) for m, f in zip(max_hits, scale)]
+
+
+def close_metrics(
+    metrics: MetricsSink,
+    max_hits: List[int],
+    return_series: bool,
+    early_stopping: Optional[EarlyStopping] = None,
+    target_hits: Optional[np.ndarray] = None,
+    topology_labels: Optional[List[str]] = None,
+):
+    # without a sink of their own, callers get the series back as lists
+    converged_step = (
+        None if early_stopping is None else (early_stopping.converged_step)
+    )
+    summary = {"max_hits": max_hits, "converged_step": converged_step}
+    if target_hits is not None:
+        summary["target_hits"] = np.asarray(target_hits).tolist()
+    if topology_labels is not None:
+        # labels of the groups in report order, the static group first
+        summary["group_labels"] = ["No Topology"] + list(topology_labels)
+    handle = metrics.close(**summary)
+    if not return_series:
+        return handle
+    return (
+        *load_metrics(handle, "cumulative_hits").T.tolist(),
+        *max_hits,
+    )
+
+
+def create_target_grid(env: Env) -> Optional[SpatialHashGrid]:
+    # a single target tests every agent, as fast as one grid query
+    if len(env.get_targets()) == 1:
+        return None
+    return SpatialHashGrid(2 * env.radius)
+
+
+def count_target_hits(
+    env: Env,
+    positions: np.ndarray,
+    group: np.ndarray,
+    target_hits: np.ndarray,
+    grid: Optional[SpatialHashGrid] = None,
+) -> np.ndarray:
+    """
+    param positions: (n, 2) agent positions
+    param group: group of every agent
+    param target_hits: (target, group) cumulative hits of every target,
+    updated in place
+
+    Return the number of targets every agent is in
+    """
+    target_ids, agent_ids = calculate_target_hits(
+        positions, env.get_target_centers(), env.radius, grid
+    )
+    np.add.at(target_hits, (target_ids, group[agent_ids]), 1)
+    return np.bincount(agent_ids, minlength=len(positions))
+
+
+def move_targets(env: Env, dt) -> np.ndarray:
+    # move the targets, return their positions before the move
+    old_centers = env.get_target_centers()
+    env.move_hole(dt)
+    return old_centers
+
+
+def record_transitions(env: Env, old_centers: np.ndarray) -> None:
+    # record the transition of every target
+    for (old_x, old_y), (new_x, new_y) in zip(
+        old_centers, env.get_target_centers()
+    ):
+        env.update_state_transition_matrix(old_x, old_y, new_x, new_y)
+
+
+def open_trajectory(
+    recorder: TrajectoryRecorder,
+    num_steps,
+    num_agents,
+    width,
+    height,
+    radius,
+    initial_boundary_width,
+    topology_labels,
+    start=0,
+    num_targets=1,
+):
+    group_labels = list(topology_labels) + ["No Topology"]
+    recorder.open(
+        num_steps,
+        len(group_labels),
+        num_agents,
+        {
+            "width": width,
+            "height": height,
+            "radius": radius,
+            "initial_boundary_width": initial_boundary_width,
+            "group_labels": group_labels,
+        },
+        start,
+        num_targets,
+    )
+
+
+def boundary_scale(env: Env) -> float:
+    # side of the square boundary over its initial side
+    min_x, _, max_x, _ = env.get_boundary().bounds
+    return (max_x - min_x) / env.initial_boundary_width
 
 
 def run_simulation(
@@ -47,7 +302,88 @@ def run_simulation(
     dt,
     num_steps,
     expansion_times,
+    engine="object",
+    seed=None,
+    checkpoint_path=None,
+    checkpoint_every=100,
+    resume=False,
+    metrics_sink: Optional[MetricsSink] = None,
+    early_stopping: Optional[EarlyStopping] = None,
+    link_percentage_list=(0.1, 0.5, 0.9),
+    trajectory_recorder: Optional[TrajectoryRecorder] = None,
+    num_targets=1,
+    topologies: Optional[Sequence[Topology]] = None,
+    profiler: Optional[StepProfiler] = None,
+    run_name=None,
 ):
+    """
+    param engine: "object" walks ContiAgent objects one by one, "vector"
+    keeps the agents in NumPy arrays, see run_vector_simulation
+    param seed: int, SeedSequence or Generator of the run; every random
+    draw (Env, agents, topologies, strategies) comes from the Generator
+    built from it, so the same seed gives the same result
+    param checkpoint_path, checkpoint_every, resume: checkpointing of the
+    vector engine, see run_vector_simulation
+    param metrics_sink: MetricsSink the cumulative hits and the changes per
+    step are streamed to; the run then returns its MetricsHandle, with the
+    max hits in handle.summary, instead of the series
+    param early_stopping: EarlyStopping policy, off if None; once
+    changes_per_step has settled the remaining steps are run with frozen
+    omega matrices or extrapolated. The step of convergence is logged,
+    kept in early_stopping.converged_step and in handle.summary
+    param link_percentage_list: link probabilities of the mesh groups,
+    one mesh group per value (see count_groups)
+    param topologies: topologies of the dynamic groups instead of the
+    meshes, star and ring, any number of them: GraphData (e.g. from
+    Generator.AgentGraphGenerator), networkx graphs, SparseAdjacency or
+    CSR (data, indices, indptr) arrays, each with num_agents agents. They
+    stay fixed, and the FJ and omega updates only touch their edges, so a
+    step costs O(agents + edges). The static group is still reported
+    first
+    param profiler: StepProfiler the time and allocations of every phase
+    of the step loop are accumulated in, off if None; its report is
+    written when the run ends
+    param run_name: name of the convergence plot and task matrix files of
+    the run, num_agents if None; runs with the same num_agents need
+    different names
+    param trajectory_recorder: TrajectoryRecorder the agent positions,
+    hole and boundary of every step are recorded to, for replay
+    param num_targets: number of holes moving at once. An agent scores
+    one hit per target it is in; the hits of every target and group
+    (static group first) are kept in handle.summary["target_hits"]. With
+    more than one target, hits are found through a SpatialHashGrid of
+    the agents, so every target only tests the agents of nearby cells
+    """
+    if engine == "vector":
+        return run_vector_simulation(
+            width,
+            height,
+            radius,
+            initial_boundary_width,
+            velocity,
+            num_agents,
+            dt,
+            num_steps,
+            expansion_times,
+            seed,
+            checkpoint_path=checkpoint_path,
+            checkpoint_every=checkpoint_every,
+            resume=resume,
+            metrics_sink=metrics_sink,
+            early_stopping=early_stopping,
+            link_percentage_list=link_percentage_list,
+            trajectory_recorder=trajectory_recorder,
+            num_targets=num_targets,
+            topologies=topologies,
+            profiler=profiler,
+            run_name=run_name,
+        )
+    if engine != "object":
+        raise ValueError(f"Unknown simulation engine: {engine}")
+    if checkpoint_path is not None:
+        raise ValueError("Checkpointing needs engine='vector'")
+    rng = np.random.default_rng(seed)
+
     # create environment
     env = Env(
         width,
@@ -56,144 +392,418 @@ def run_simulation(
         velocity,
         initial_boundary_width,
         expansion_times,
+        rng=rng,
+        num_targets=num_targets,
     )
 
-    def create_adjcacency_matrix(
-        num_agents, link_percentage_list
-    ) -> list[np.array]:
-        # create a adjcency matrix to represent a mesh topology
-        matrix_to_return = []
-        for link_percentage in link_percentage_list:
-            mesh_adjacency_matrix = (
-                np.random.rand(num_agents, num_agents) < link_percentage
-            ).astype(int)
-            np.fill_diagonal(mesh_adjacency_matrix, 0)
-            matrix_to_return.append(mesh_adjacency_matrix)
-
-        # create a adjcency matrix to represent a star topology
-        star_adjacency_matrix = np.zeros((num_agents, num_agents))
-        star_adjacency_matrix[:, 0] = 1
-        star_adjacency_matrix[0, :] = 1
-        np.fill_diagonal(star_adjacency_matrix, 0)
-        matrix_to_return.append(star_adjacency_matrix)
-
-        # create a adjcency matrix to represent a ring topology
-        ring_adjacency_matrix = np.zeros((num_agents, num_agents))
-        for i in range(num_agents):
-            ring_adjacency_matrix[i, (i + 1) % num_agents] = 1
-            ring_adjacency_matrix[(i + 1) % num_agents, i] = 1
-        np.fill_diagonal(ring_adjacency_matrix, 0)
-        matrix_to_return.append(ring_adjacency_matrix)
-
-        return matrix_to_return
-
     # initialize variables
-    cumulative_hits_over_time = [[] for _ in range(6)]
-    agent_hits = [[0] * num_agents for _ in range(6)]
-    total_hits = [0] * 6
-    link_percentage_list = [0.1, 0.5, 0.9]  # 0.1, 0.3, 0.5, 0.7, 0.9
+    topology, omega_matrices, topology_labels = create_topologies(
+        num_agents, link_percentage_list, topologies, rng
+    )
+    num_dynamic_groups = len(omega_matrices)
+    num_groups = num_dynamic_groups + 1
+    report_order = [num_dynamic_groups] + list(range(num_dynamic_groups))
 
-    omega_matrices = [np.ones((num_agents, num_agents)) for _ in range(5)]
-    for omega_matrix in omega_matrices:
-        np.fill_diagonal(omega_matrix, 0)
+    metrics = MemoryMetricsSink() if metrics_sink is None else metrics_sink
+    metrics.open(num_steps, num_groups=num_groups)
+    if trajectory_recorder is not None:
+        open_trajectory(
+            trajectory_recorder,
+            num_steps,
+            num_agents,
+            width,
+            height,
+            radius,
+            initial_boundary_width,
+            topology_labels,
+            num_targets=num_targets,
+        )
+    agent_hits = [[0] * num_agents for _ in range(num_groups)]
+    total_hits = [0] * num_groups
+    # hits of every target, in agent order (dynamic groups, static last)
+    target_hits = np.zeros((num_targets, num_groups), dtype=int)
+    agent_group = np.repeat(np.arange(num_groups), num_agents)
+    grid = create_target_grid(env)
 
     expansion_factor = expansion_times ** (1 / num_steps)
-    changes_per_step = []
 
-    # create agents: 5 groups of dynamic agents and 1 group of static agents
+    # create agents: one group of dynamic agents per topology and 1 group
+    # of static agents
     dynamic_agents = [
-        _Agent.create(i, env.get_boundary()) for i in range(num_agents * 5)
+        _Agent.create(i, env.get_boundary(), rng)
+        for i in range(num_agents * num_dynamic_groups)
     ]
     static_agents = [
-        _Agent.create(i + 5 * num_agents, env.get_boundary())
+        _Agent.create(
+            i + num_dynamic_groups * num_agents, env.get_boundary(), rng
+        )
         for i in range(num_agents)
     ]
     all_agents = dynamic_agents + static_agents
 
+    if early_stopping is not None:
+        early_stopping.reset()
+    profiler = NullProfiler() if profiler is None else profiler
+    profiler.start()
+
     # start simulation
     for step in range(num_steps):
         # expand polygon and move the agents
         env.expand_boundary(expansion_factor)
         for agent in all_agents:
-            _Agent.update_boundary(agent, env.get_boundary())
-        hits_info = [{} for _ in range(5)]
+            _Agent.update_boundary(agent, env.get_boundary(), rng)
+        profiler.lap("boundary_expansion")
+        hits_info = [{} for _ in range(num_dynamic_groups)]
         for agent in all_agents:
             _Agent.move(agent, dt)
+        profiler.lap("agent_movement")
 
-        # five group of dynamic agents
+        # groups of dynamic agents
         dynamic_agents_groups = [
             dynamic_agents[slice(i * num_agents, (i + 1) * num_agents)]
-            for i in range(5)
+            for i in range(num_dynamic_groups)
         ]
 
         # calculate hits
-        hits = [calculate_hits(static_agents, env.get_target_hole())] + [
-            calculate_hits(group, env.get_target_hole())
-            for group in dynamic_agents_groups
+        positions = np.array(
+            [[agent.position.x, agent.position.y] for agent in all_agents]
+        )
+        hit_counts = count_target_hits(
+            env, positions, agent_group, target_hits, grid
+        )
+        if trajectory_recorder is not None:
+            trajectory_recorder.record(
+                step,
+                positions,
+                env.get_target_centers(),
+                boundary_scale(env),
+            )
+        group_counts = np.split(hit_counts, num_groups)
+        hits = [
+            list(compress(zip(group, counts.tolist()), counts))
+            for group, counts in zip(
+                [static_agents] + dynamic_agents_groups,
+                [group_counts[i] for i in report_order],
+            )
         ]
 
         # update cumulative hits info
         for i, hit_group in enumerate(hits):
-            for hit in hit_group:
+            for hit, count in hit_group:
                 idx = hit.id % num_agents
-                agent_hits[i][idx] += 1
+                agent_hits[i][idx] += count
                 if i > 0:
                     hits_info[i - 1][
                         dynamic_agents_groups[i - 1][idx].id
                     ] = hit
-            total_hits[i] += len(hit_group)
-            cumulative_hits_over_time[i].append(total_hits[i])
-
-        # move the hole
-        old_position = Point(env.hole_x, env.hole_y)
-        new_position = env.move_hole(dt)
-        env.update_state_transition_matrix(
-            old_position.x, old_position.y, new_position.x, new_position.y
-        )
+                total_hits[i] += count
+        profiler.lap("hit_detection")
+
+        # move the holes
+        old_centers = move_targets(env, dt)
+        profiler.lap("hole_movement")
+        record_transitions(env, old_centers)
+        profiler.lap("transition_update")
 
         # update agents with omega matrix, and calculate change in this step
+        # (nothing changes once converged with frozen omega matrices)
         change_in_this_step = 0
-        temp_matrix_list = create_adjcacency_matrix(
-            num_agents, link_percentage_list
-        )
-        for i, group in enumerate(dynamic_agents_groups):
+        frozen = early_stopping is not None and early_stopping.converged
+        temp_matrix_list = [] if frozen else topology.sample()
+        profiler.lap("topology_sampling")
+        for i in range(0 if frozen else len(dynamic_agents_groups)):
             change, omega_matrices[i] = update_agents(
-                group,
+                dynamic_agents_groups[i],
                 num_agents,
                 omega_matrices[i],
                 hits_info[i],
                 temp_matrix_list[i],
+                rng,
             )
             change_in_this_step += change
-        changes_per_step.append(
-            change_in_this_step / len(dynamic_agents_groups)
+        change_in_this_step /= len(dynamic_agents_groups)
+        profiler.lap("omega_update")
+        metrics.write(
+            step,
+            cumulative_hits=total_hits,
+            changes_per_step=change_in_this_step,
         )
+        if (
+            early_stopping is not None
+            and not frozen
+            and early_stopping.update(step, change_in_this_step, total_hits)
+            and early_stopping.mode == "extrapolate"
+        ):
+            profiler.lap("bookkeeping")
+            break
+        profiler.lap("bookkeeping")
 
-    # plot the convergence graph with change per step
-    save_path = (
-        save_path_dict["simulation"] + "convergence" + f"_{num_agents}.png"
+    max_hits = [max(hits) for hits in agent_hits]
+    if early_stopping is not None and early_stopping.mode == "extrapolate":
+        if early_stopping.converged:
+            max_hits = extrapolate_run(
+                early_stopping,
+                metrics,
+                num_steps,
+                expansion_factor,
+                total_hits,
+                max_hits,
+            )
+    metrics.flush()
+    if trajectory_recorder is not None:
+        trajectory_recorder.close()
+    profiler.close(
+        engine="object",
+        num_agents=num_agents,
+        num_groups=num_groups,
+        num_targets=num_targets,
     )
-    plot_convergence(num_steps, changes_per_step, save_path)
-    logging.info(
-        f"Convergence plot saved at {save_path_dict['simulation']}convergence_"
-        f"{num_agents}.png"
+    save_simulation_results(
+        env,
+        num_agents if run_name is None else run_name,
+        num_steps,
+        metrics.read("changes_per_step"),
     )
 
-    # save task matrix and check its properties
-    task_matrix = env.state_transition_matrix
-    assert not np.all(task_matrix == 0)
-    for row in task_matrix:
-        assert np.sum(row) == 1 or np.sum(row) == 0
-    np.save(
-        save_path_dict["task_matrix"] + str(num_agents) + ".npy", task_matrix
+    # return cumulative hits over time and max hits
+    return close_metrics(
+        metrics,
+        max_hits,
+        metrics_sink is None,
+        early_stopping,
+        target_hits[:, report_order],
+        topology_labels,
     )
-    logging.info(
-        f"Task matrix saved at {save_path_dict['task_matrix']}{num_agents}.npy"
+
+
+def run_vector_simulation(
+    width,
+    height,
+    radius,
+    initial_boundary_width,
+    velocity,
+    num_agents,
+    dt,
+    num_steps,
+    expansion_times,
+    seed=None,
+    checkpoint_path=None,
+    checkpoint_every=100,
+    resume=False,
+    metrics_sink: Optional[MetricsSink] = None,
+    early_stopping: Optional[EarlyStopping] = None,
+    link_percentage_list=(0.1, 0.5, 0.9),
+    trajectory_recorder: Optional[TrajectoryRecorder] = None,
+    num_targets=1,
+    topologies: Optional[Sequence[Topology]] = None,
+    profiler: Optional[StepProfiler] = None,
+    run_name=None,
+):
+    """
+    Same simulation as run_simulation, with positions, directions, speeds
+    and group ids of all agents held in contiguous arrays, so that boundary
+    update, move, bounce and hit detection are whole-array operations
+
+    param checkpoint_path: .npz file the state is saved to every
+    checkpoint_every steps, no checkpoints if None
+    param resume: continue from checkpoint_path if it exists; the result
+    is the same as that of an uninterrupted run with the same seed; a
+    metrics sink that keeps its series on disk must be given the same path
+    """
+    rng = np.random.default_rng(seed)
+
+    # create environment
+    env = Env(
+        width,
+        height,
+        radius,
+        velocity,
+        initial_boundary_width,
+        expansion_times,
+        rng=rng,
+        num_targets=num_targets,
+    )
+
+    # initialize variables
+    topology, omega_matrices, topology_labels = create_topologies(
+        num_agents, link_percentage_list, topologies, rng
+    )
+    num_dynamic_groups = len(omega_matrices)
+    num_groups = num_dynamic_groups + 1
+    expansion_factor = expansion_times ** (1 / num_steps)
+
+    # create agents: the dynamic groups first, the static group last
+    agents = _AgentArray.create(
+        num_agents, num_groups, env.get_boundary(), rng
+    )
+    groups = [
+        slice(i * num_agents, (i + 1) * num_agents) for i in range(num_groups)
+    ]
+    # results are reported with the static group first, as in run_simulation
+    report_order = [num_dynamic_groups] + list(range(num_dynamic_groups))
+
+    agent_hits = np.zeros(num_agents * num_groups, dtype=int)
+    total_hits = np.zeros(num_groups, dtype=int)
+    target_hits = np.zeros((num_targets, num_groups), dtype=int)
+    grid = create_target_grid(env)
+
+    metrics = MemoryMetricsSink() if metrics_sink is None else metrics_sink
+
+    first_step = 0
+    checkpoint = None
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path)
+        first_step = int(checkpoint["step"])
+    metrics.open(num_steps, first_step, num_groups)
+    if trajectory_recorder is not None:
+        open_trajectory(
+            trajectory_recorder,
+            num_steps,
+            num_agents,
+            width,
+            height,
+            radius,
+            initial_boundary_width,
+            topology_labels,
+            first_step,
+            num_targets,
+        )
+    if early_stopping is not None:
+        early_stopping.reset()
+    if checkpoint is not None:
+        restore_checkpoint(
+            checkpoint, agents, env, metrics, rng, early_stopping
+        )
+        omega_matrices = load_omega_matrices(checkpoint)
+        agent_hits = checkpoint["agent_hits"]
+        total_hits = checkpoint["total_hits"]
+        target_hits = checkpoint["target_hits"]
+        logging.info(f"Resumed from {checkpoint_path} at step {first_step}")
+    profiler = NullProfiler() if profiler is None else profiler
+    profiler.start()
+
+    # start simulation
+    for step in range(first_step, num_steps):
+        # expand polygon and move the agents
+        env.expand_boundary(expansion_factor)
+        _AgentArray.update_boundary(agents, env.get_boundary(), rng)
+        profiler.lap("boundary_expansion")
+        _AgentArray.move(agents, dt)
+        profiler.lap("agent_movement")
+
+        # calculate hits and update cumulative hits info
+        hit_counts = count_target_hits(
+            env, agents.position, agents.group, target_hits, grid
+        )
+        if trajectory_recorder is not None:
+            trajectory_recorder.record(
+                step,
+                agents.position,
+                env.get_target_centers(),
+                boundary_scale(env),
+            )
+        hit_mask = hit_counts > 0
+        agent_hits += hit_counts
+        total_hits += np.bincount(
+            agents.group, hit_counts, minlength=num_groups
+        ).astype(int)
+        hits_info = [
+            dict.fromkeys(agents.id[group][hit_mask[group]].tolist())
+            for group in groups[:num_dynamic_groups]
+        ]
+        profiler.lap("hit_detection")
+
+        # move the holes
+        old_centers = move_targets(env, dt)
+        profiler.lap("hole_movement")
+        record_transitions(env, old_centers)
+        profiler.lap("transition_update")
+
+        # update agents with omega matrix, and calculate change in this step
+        # (nothing changes once converged with frozen omega matrices)
+        change_in_this_step = 0
+        frozen = early_stopping is not None and early_stopping.converged
+        temp_matrix_list = [] if frozen else topology.sample()
+        profiler.lap("topology_sampling")
+        for i in range(0 if frozen else num_dynamic_groups):
+            change, omega_matrices[i] = update_agent_arrays(
+                agents,
+                groups[i],
+                omega_matrices[i],
+                hits_info[i],
+                temp_matrix_list[i],
+                rng,
+            )
+            change_in_this_step += change
+        change_in_this_step /= num_dynamic_groups
+        profiler.lap("omega_update")
+        metrics.write(
+            step,
+            cumulative_hits=total_hits[report_order],
+            changes_per_step=change_in_this_step,
+        )
+        if (
+            early_stopping is not None
+            and not frozen
+            and early_stopping.update(
+                step, change_in_this_step, total_hits[report_order]
+            )
+            and early_stopping.mode == "extrapolate"
+        ):
+            profiler.lap("bookkeeping")
+            break
+
+        if checkpoint_path and (step + 1) % checkpoint_every == 0:
+            if trajectory_recorder is not None:
+                trajectory_recorder.flush()
+            save_checkpoint(
+                checkpoint_path,
+                step + 1,
+                agents,
+                omega_matrices,
+                env,
+                agent_hits,
+                total_hits,
+                metrics,
+                rng,
+                early_stopping,
+                target_hits,
+            )
+        profiler.lap("bookkeeping")
+
+    max_hits = [int(agent_hits[groups[i]].max()) for i in report_order]
+    if early_stopping is not None and early_stopping.mode == "extrapolate":
+        if early_stopping.converged:
+            max_hits = extrapolate_run(
+                early_stopping,
+                metrics,
+                num_steps,
+                expansion_factor,
+                total_hits[report_order],
+                max_hits,
+            )
+    metrics.flush()
+    if trajectory_recorder is not None:
+        trajectory_recorder.close()
+    profiler.close(
+        engine="vector",
+        num_agents=num_agents,
+        num_groups=num_groups,
+        num_targets=num_targets,
+    )
+    save_simulation_results(
+        env,
+        num_agents if run_name is None else run_name,
+        num_steps,
+        metrics.read("changes_per_step"),
     )
 
     # return cumulative hits over time and max hits
-    max_hits = [max(hits) for hits in agent_hits]
-    return (
-        *cumulative_hits_over_time,
-        *max_hits,
+    return close_metrics(
+        metrics,
+        max_hits,
+        metrics_sink is None,
+        early_stopping,
+        target_hits[:, report_order],
+        topology_labels,
     )
@@ -1,14 +1,17 @@
 import logging
-from typing import List, Tuple
+import os
+from typing import List, Optional, Tuple
 
-import imageio
 import numpy as np
 import pygame
 from Agent_simulator.agent import _Agent  # Agent
+from Agent_simulator.topology import TopologyProvider
 from Agent_simulator.update_strategy import Para_update_strategies as Opinion
 from Env_simulator.env import Env
 from Plotter.simulation_plotter import plot_convergence
 from shapely.geometry import Point
+from Simulator.profiler import NullProfiler, StepProfiler
+from Simulator.replay import open_animation_writer
 from utils import calculate_hits
 
 logging.basicConfig(level=logging.INFO)
@@ -26,14 +29,13 @@ def update_agents(
     omega_matrix: np.ndarray,
     hits_info: List[dict],
     temp_matrix: np.ndarray,
+    rng: Optional[np.random.Generator] = None,
 ) -> Tuple[float, np.ndarray]:
-    for agent in agents:
-        # Opinion.FJ_update_parameters_adapt(
-        #     agent, len_agents, omega_matrix, agents, temp_matrix
-        # )
-        Opinion.FJ_update_parameters(
-            agent, len_agents, omega_matrix, agents, temp_matrix
-        )
+    # for agent in agents:
+    #     Opinion.FJ_update_parameters_adapt(
+    #         agent, len_agents, omega_matrix, agents, temp_matrix
+    #     )
+    Opinion.FJ_update_group(agents, omega_matrix, temp_matrix, rng)
     change_in_this_step, omega_matrix = _Agent.update_omega_matrix(
         omega_matrix, hits_info
     )
@@ -51,16 +53,41 @@ def run_simulation(
     num_steps,
     FPS,
     expansion_times,
+    seed=None,
+    headless=False,
+    render_every=1,
+    resolution=None,
+    animation_path=None,
+    profiler: Optional[StepProfiler] = None,
 ):
+    """
+    param seed: int, SeedSequence or Generator of every random draw of the
+    run
+    param headless: draw on an offscreen surface, without a window and
+    without holding every step to the frame rate
+    param render_every: draw and save every k-th step only
+    param resolution: (width, height) of the frames, (width, height) of
+    the environment if None
+    param animation_path: .gif or .mp4 (needs imageio-ffmpeg) the frames
+    are streamed to, plots/animation/simulation_<num_agents>.gif if None
+    param profiler: StepProfiler of the phases of the step loop, rendering
+    included, off if None
+    """
+    rng = np.random.default_rng(seed)
+    render_width, render_height = resolution or (width, height)
+    scale_x, scale_y = render_width / width, render_height / height
+
+    def to_screen(x, y):
+        return (
+            int((x + width / 2) * scale_x),
+            int((y + height / 2) * scale_y),
+        )
 
     def draw_polygon(screen, boundary, color):
         pygame.draw.polygon(
             screen,
             color,
-            [
-                (int(x + width / 2), int(y + height / 2))
-                for x, y in boundary.exterior.coords
-            ],
+            [to_screen(x, y) for x, y in boundary.exterior.coords],
             1,
         )
 
@@ -68,51 +95,20 @@ def run_simulation(
         pygame.draw.circle(
             screen,
             color,
-            (int(env.hole_x + width / 2), int(env.hole_y + height / 2)),
-            env.radius,
+            to_screen(env.hole_x, env.hole_y),
+            max(1, int(env.radius * scale_x)),
         )
 
     def draw_agents(screen, agents, color):
+        agent_radius = max(1, int(scale_x))
         for agent in agents:
             pygame.draw.circle(
                 screen,
                 color,
-                (
-                    int(agent.position.x + width / 2),
-                    int(agent.position.y + height / 2),
-                ),
-                1,
+                to_screen(agent.position.x, agent.position.y),
+                agent_radius,
             )
 
-    def create_adjcacency_matrix(
-        num_agents, link_percentage_list
-    ) -> list[np.array]:
-        # create a adjcency matrix to represent a mesh topology
-        matrix_to_return = []
-        for link_percentage in link_percentage_list:
-            mesh_adjacency_matrix = (
-                np.random.rand(num_agents, num_agents) < link_percentage
-            ).astype(int)
-            np.fill_diagonal(mesh_adjacency_matrix, 0)
-            matrix_to_return.append(mesh_adjacency_matrix)
-
-        # create a adjcency matrix to represent a star topology
-        star_adjacency_matrix = np.zeros((num_agents, num_agents))
-        star_adjacency_matrix[:, 0] = 1
-        star_adjacency_matrix[0, :] = 1
-        np.fill_diagonal(star_adjacency_matrix, 0)
-        matrix_to_return.append(star_adjacency_matrix)
-
-        # create a adjcency matrix to represent a ring topology
-        ring_adjacency_matrix = np.zeros((num_agents, num_agents))
-        for i in range(num_agents):
-            ring_adjacency_matrix[i, (i + 1) % num_agents] = 1
-            ring_adjacency_matrix[(i + 1) % num_agents, i] = 1
-        np.fill_diagonal(ring_adjacency_matrix, 0)
-        matrix_to_return.append(ring_adjacency_matrix)
-
-        return matrix_to_return
-
     # create environment
     env = Env(
         width,
@@ -121,6 +117,7 @@ def run_simulation(
         velocity,
         initial_boundary_width,
         expansion_times,
+        rng=rng,
     )
     # initialize variables
     cumulative_hits_over_time = [[] for _ in range(6)]
@@ -132,34 +129,48 @@ def run_simulation(
     for omega_matrix in omega_matrices:
         np.fill_diagonal(omega_matrix, 0)
 
+    topology = TopologyProvider(num_agents, link_percentage_list, rng)
     expansion_factor = expansion_times ** (1 / num_steps)
     changes_per_step = []
 
     # create agents: 5 groups of dynamic agents and 1 group of static agents
     dynamic_agents = [
-        _Agent.create(i, env.get_boundary()) for i in range(num_agents * 5)
+        _Agent.create(i, env.get_boundary(), rng)
+        for i in range(num_agents * 5)
     ]
     static_agents = [
-        _Agent.create(i + 5 * num_agents, env.get_boundary())
+        _Agent.create(i + 5 * num_agents, env.get_boundary(), rng)
         for i in range(num_agents)
     ]
     all_agents = dynamic_agents + static_agents
 
-    pygame.init()
-    screen = pygame.display.set_mode((width, height))
-    pygame.display.set_caption("Needle Throw Simulation")
+    if headless:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+        screen = pygame.Surface((render_width, render_height))
+    else:
+        pygame.init()
+        screen = pygame.display.set_mode((render_width, render_height))
+        pygame.display.set_caption("Needle Throw Simulation")
     clock = pygame.time.Clock()
     FPS = 60
 
-    frames = []
+    if animation_path is None:
+        animation_path = (
+            save_path_dict["animation"] + f"simulation_{num_agents}.gif"
+        )
+    writer = open_animation_writer(animation_path, FPS)
     changes_per_step = []
+    profiler = NullProfiler() if profiler is None else profiler
+    profiler.start()
 
     # start simulation
     for step in range(num_steps):
         # expand polygon and move the agents
         env.expand_boundary(expansion_factor)
         for agent in all_agents:
-            _Agent.update_boundary(agent, env.get_boundary())
+            _Agent.update_boundary(agent, env.get_boundary(), rng)
+        profiler.lap("boundary_expansion")
         hits_info = [{} for _ in range(5)]
         for agent in all_agents:
             _Agent.move(agent, dt)
@@ -168,6 +179,7 @@ def run_simulation(
             assert env.get_boundary().contains(
                 agent.position
             ) or env.get_boundary().touches(agent.position)
+        profiler.lap("agent_movement")
 
         # five group of dynamic agents
         dynamic_agents_groups = [
@@ -192,20 +204,22 @@ def run_simulation(
                     ] = hit
             total_hits[i] += len(hit_group)
             cumulative_hits_over_time[i].append(total_hits[i])
+        profiler.lap("hit_detection")
 
         # move the hole
         old_position = Point(env.hole_x, env.hole_y)
         new_position = env.move_hole(dt)
+        profiler.lap("hole_movement")
         env.update_state_transition_matrix(
             old_position.x, old_position.y, new_position.x, new_position.y
         )
+        profiler.lap("transition_update")
         # print("Now the speed is: ", env.velocity)
 
         # update agents with omega matrix, and calculate change in this step
         change_in_this_step = 0
-        temp_matrix_list = create_adjcacency_matrix(
-            num_agents, link_percentage_list
-        )
+        temp_matrix_list = topology.sample()
+        profiler.lap("topology_sampling")
         for i, group in enumerate(dynamic_agents_groups):
             change, omega_matrices[i] = update_agents(
                 group,
@@ -213,12 +227,17 @@ def run_simulation(
                 omega_matrices[i],
                 hits_info[i],
                 temp_matrix_list[i],
+                rng,
             )
             change_in_this_step += change
+        profiler.lap("omega_update")
         changes_per_step.append(
             change_in_this_step / len(dynamic_agents_groups)
         )
+        profiler.lap("bookkeeping")
 
+        if step % render_every != 0:
+            continue
         screen.fill((255, 255, 255))
         draw_polygon(screen, env.get_boundary(), (0, 0, 0))
         draw_hole(screen, env, (255, 0, 0))
@@ -226,12 +245,15 @@ def run_simulation(
         draw_agents(screen, dynamic_agents_groups[2], (0, 255, 0))
         # draw_agents(screen, dynamic_agents_groups[1], (255, 0, 255))
         # draw_agents(screen, dynamic_agents_groups[2], (255, 255, 0))
-        pygame.display.flip()
-        clock.tick(FPS)
+        if not headless:
+            pygame.display.flip()
+            clock.tick(FPS)
 
         frame = pygame.surfarray.array3d(screen)
         frame = frame.transpose([1, 0, 2])
-        frames.append(frame)
+        writer.append_data(frame)
+        profiler.lap("rendering")
+    profiler.close(engine="visual", num_agents=num_agents)
 
     # plot the convergence graph with change per step
     save_path = (
@@ -243,24 +265,23 @@ def run_simulation(
         f"{num_agents}.png"
     )
 
-    # save task matrix and check its properties
-    task_matrix = env.state_transition_matrix
-    assert not np.all(task_matrix == 0)
-    for row in task_matrix:
-        assert np.sum(row) == 1 or np.sum(row) == 0
-    np.save(
-        save_path_dict["task_matrix"] + str(num_agents) + ".npy", task_matrix
+    # save task matrix (CSR, scipy.sparse.load_npz compatible) and check
+    # its properties
+    data, _, indptr = env.get_state_transition_matrix()
+    assert data.size > 0
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    row_sums = np.bincount(rows, weights=data, minlength=len(indptr) - 1)
+    assert np.all(np.isclose(row_sums, 1) | (row_sums == 0))
+    env.state_transition_counts.save_npz(
+        save_path_dict["task_matrix"] + str(num_agents) + ".npz"
     )
     logging.info(
-        f"Task matrix saved at {save_path_dict['task_matrix']}{num_agents}.npy"
+        f"Task matrix saved at {save_path_dict['task_matrix']}{num_agents}.npz"
     )
 
     pygame.quit()
-    animation_save_path = (
-        save_path_dict["animation"] + f"simulation_{num_agents}.gif"
-    )
-    imageio.mimsave(animation_save_path, frames, fps=FPS)
-    logging.info(f"Animation saved at {animation_save_path}")
+    writer.close()
+    logging.info(f"Animation saved at {animation_path}")
 
     # return cumulative hits over time and max hits
     max_hits = [max(hits) for hits in agent_hits]
@@ -0,0 +1,476 @@
+import glob
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from interface import MetricsHandle
+
+# time series written by run_simulation, one row per step, for the six
+# groups of the default topologies; runs of other topologies use
+# metrics_layout
+METRICS = {
+    "cumulative_hits": ((6,), np.int64),  # static group first
+    "changes_per_step": ((), np.float64),
+}
+
+
+def metrics_layout(num_groups: int) -> Dict[str, Tuple[tuple, type]]:
+    # METRICS of a run with num_groups groups
+    return {**METRICS, "cumulative_hits": ((num_groups,), np.int64)}
+
+
+class MetricsSink:
+    """
+    Receives the per-step metrics of a simulation. Rows are buffered and
+    handed to the backend every flush_every steps, so a run only holds
+    flush_every rows in memory whatever its length. close() returns a
+    small MetricsHandle instead of the series themselves.
+    """
+
+    backend = ""
+    # the rows are kept on disk and survive the process
+    persistent = False
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        flush_every: int = 1000,
+    ):
+        if self.persistent and path is None:
+            raise ValueError(f"The {self.backend} metrics sink needs a path")
+        self.path = path
+        self.flush_every = flush_every
+        self.metrics = METRICS
+        self.num_steps = 0
+        self.num_written = 0
+        self._buffer: List[Dict[str, np.ndarray]] = []
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.metrics)
+
+    def open(
+        self, num_steps: int, start: int = 0, num_groups: int = 6
+    ) -> None:
+        """
+        param num_steps: number of steps of the run
+        param start: first step to be written; rows before it are kept
+        from an earlier, interrupted run of the same sink (see checkpoint)
+        param num_groups: number of agent groups of the run
+        """
+        self.metrics = metrics_layout(num_groups)
+        self.num_steps = num_steps
+        self.num_written = start
+        self._buffer = []
+
+    def write(self, step: int, **values) -> None:
+        if step != self.num_written + len(self._buffer):
+            raise ValueError(
+                f"Metrics of step {step} written out of order, expected "
+                f"step {self.num_written + len(self._buffer)}"
+            )
+        # copy, the caller may keep updating the values in place
+        self._buffer.append(
+            {
+                name: np.array(values[name], dtype)
+                for name, (_, dtype) in self.metrics.items()
+            }
+        )
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        rows = {
+            name: np.stack([values[name] for values in self._buffer])
+            for name in self.names
+        }
+        self.write_rows(self.num_written, **rows)
+        self._buffer = []
+
+    def write_rows(self, start: int, **rows: np.ndarray) -> None:
+        # rows[name] holds the steps start, start + 1, ... of metric name
+        num_rows = len(next(iter(rows.values())))
+        self._write_rows(start, rows)
+        self.num_written = max(self.num_written, start + num_rows)
+
+    def _write_rows(self, start: int, rows: Dict[str, np.ndarray]) -> None:
+        raise NotImplementedError
+
+    def read(self, name: str) -> np.ndarray:
+        """
+        Return the flushed rows of metric name
+        """
+        raise NotImplementedError
+
+    def close(self, **summary) -> MetricsHandle:
+        """
+        param summary: small end-of-run results stored with the handle
+        """
+        self.flush()
+        handle = MetricsHandle(
+            self.backend, self.path, self.num_written, self.names, summary
+        )
+        if self.persistent:
+            with open(os.path.join(self.path, "metrics.json"), "w") as f:
+                json.dump(
+                    {
+                        "backend": handle.backend,
+                        "num_steps": handle.num_steps,
+                        "names": handle.names,
+                        "summary": handle.summary,
+                    },
+                    f,
+                )
+        return handle
+
+
+class MemoryMetricsSink(MetricsSink):
+    """
+    Keeps the series in preallocated arrays; the handle carries them
+    """
+
+    backend = "memory"
+
+    def open(
+        self, num_steps: int, start: int = 0, num_groups: int = 6
+    ) -> None:
+        super().open(num_steps, start, num_groups)
+        self._arrays = {
+            name: np.zeros((num_steps,) + shape, dtype)
+            for name, (shape, dtype) in self.metrics.items()
+        }
+
+    def _write_rows(self, start: int, rows: Dict[str, np.ndarray]) -> None:
+        for name, values in rows.items():
+            self._arrays[name][slice(start, start + len(values))] = values
+
+    def read(self, name: str) -> np.ndarray:
+        return self._arrays[name][: self.num_written]
+
+    def close(self, **summary) -> MetricsHandle:
+        handle = super().close(**summary)
+        handle.series = {name: self.read(name) for name in self.names}
+        return handle
+
+
+class NpyMetricsSink(MetricsSink):
+    """
+    One .npy file per metric under path, preallocated for the whole run
+    and written through a memory map
+    """
+
+    backend = "npy"
+    persistent = True
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name + ".npy")
+
+    def open(
+        self, num_steps: int, start: int = 0, num_groups: int = 6
+    ) -> None:
+        super().open(num_steps, start, num_groups)
+        os.makedirs(self.path, exist_ok=True)
+        self._arrays = {}
+        for name, (shape, dtype) in self.metrics.items():
+            if start > 0:
+                if not os.path.exists(self._file(name)):
+                    raise ValueError(
+                        f"Cannot resume metrics: {self._file(name)} is missing"
+                    )
+                self._arrays[name] = np.load(self._file(name), mmap_mode="r+")
+            else:
+                self._arrays[name] = np.lib.format.open_memmap(
+                    self._file(name),
+                    mode="w+",
+                    dtype=dtype,
+                    shape=(num_steps,) + shape,
+                )
+
+    def _write_rows(self, start: int, rows: Dict[str, np.ndarray]) -> None:
+        for name, values in rows.items():
+            self._arrays[name][slice(start, start + len(values))] = values
+            self._arrays[name].flush()
+
+    def read(self, name: str) -> np.ndarray:
+        return self._arrays[name][: self.num_written]
+
+
+class ChunkedMetricsSink(MetricsSink):
+    """
+    Every flush appends one file <metric>_<first step>.npy under path, so
+    nothing is allocated for steps that were not run
+    """
+
+    backend = "chunked"
+    persistent = True
+
+    def _chunks(self, name: str) -> List[Tuple[int, str]]:
+        return chunk_files(self.path, name)
+
+    def open(
+        self, num_steps: int, start: int = 0, num_groups: int = 6
+    ) -> None:
+        super().open(num_steps, start, num_groups)
+        os.makedirs(self.path, exist_ok=True)
+        for name in self.names:
+            for first, file in self._chunks(name):
+                # drop what was written after the resumed step
+                if first >= start:
+                    os.remove(file)
+                    continue
+                values = np.load(file)
+                if first + len(values) > start:
+                    np.save(file, values[: start - first])
+
+    def _write_rows(self, start: int, rows: Dict[str, np.ndarray]) -> None:
+        for name, values in rows.items():
+            np.save(
+                os.path.join(self.path, f"{name}_{start:012d}.npy"), values
+            )
+
+    def read(self, name: str) -> np.ndarray:
+        return read_chunks(self.path, name, self.metrics[name])
+
+
+class SweepStore:
+    """
+    Metrics of all points of a sweep in preallocated .npy files under
+    path, one row per point: the series of metrics_layout, padded to
+    num_steps, and the max hits, convergence step, number of steps written
+    and number of groups. The group axes are as wide as the point with the
+    most groups; every point uses its first num_groups columns. Sweep
+    workers write their row in place through SweepMetricsSink and the
+    parent reads the files as memory maps, so no series is pickled.
+    """
+
+    summaries = ["max_hits", "converged_step", "num_steps", "num_groups"]
+
+    def __init__(self, path: str, mode: str = "r"):
+        """
+        param mode: memory map mode of the arrays, "r" or "r+"
+        """
+        self.path = path
+        with open(os.path.join(path, "store.json")) as f:
+            self.keys: List[str] = json.load(f)["keys"]
+        self.arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mode)
+            for name in list(METRICS) + self.summaries
+        }
+        self.num_steps = self.arrays[next(iter(METRICS))].shape[1]
+
+    @staticmethod
+    def summary_layout(num_groups: int) -> Dict[str, Tuple[tuple, type]]:
+        return {
+            "max_hits": ((num_groups,), np.int64),
+            "converged_step": ((), np.int64),
+            "num_steps": ((), np.int64),
+            "num_groups": ((), np.int64),
+        }
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        keys: List[str],
+        num_steps: int,
+        num_groups: List[int],
+    ):
+        """
+        param keys: keys of the sweep points, in row order
+        param num_steps: longest run of the sweep
+        param num_groups: number of groups of every point, in row order
+
+        Creates the store, or opens it if it already holds the same points
+        so an interrupted sweep keeps the rows it finished
+        """
+        info_path = os.path.join(path, "store.json")
+        if os.path.exists(info_path):
+            store = cls(path)
+            if (
+                store.keys != list(keys)
+                or store.num_steps < num_steps
+                or store.arrays["num_groups"].tolist() != list(num_groups)
+            ):
+                raise ValueError(
+                    f"Sweep store {path} belongs to another sweep, "
+                    "choose a new path"
+                )
+            return store
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            name: ((num_steps,) + shape, dtype)
+            for name, (shape, dtype) in metrics_layout(max(num_groups)).items()
+        }
+        arrays.update(cls.summary_layout(max(num_groups)))
+        for name, (shape, dtype) in arrays.items():
+            array = np.lib.format.open_memmap(
+                os.path.join(path, name + ".npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(len(keys),) + shape,
+            )
+            if name == "num_groups":
+                array[:] = num_groups
+            elif name in cls.summaries:
+                array[:] = -1
+            array.flush()
+        with open(info_path, "w") as f:
+            json.dump({"keys": list(keys)}, f)
+        return cls(path)
+
+    def read(self, name: str, index: Optional[int] = None) -> np.ndarray:
+        """
+        Memory-mapped array of name, or the row of one point trimmed to
+        the steps it wrote
+        """
+        if index is None:
+            return self.arrays[name]
+        values = self.arrays[name][index]
+        if name not in self.summaries:
+            values = values[slice(max(self.arrays["num_steps"][index], 0))]
+        # the groups of the point
+        if values.ndim > (name not in self.summaries):
+            values = values[..., slice(self.arrays["num_groups"][index])]
+        return values
+
+
+class SweepMetricsSink(MetricsSink):
+    """
+    Writes the metrics of one sweep point into its row of a SweepStore
+    """
+
+    backend = "sweep"
+    persistent = True
+
+    def __init__(self, path: str, index: int, flush_every: int = 1000):
+        super().__init__(path, flush_every)
+        self.index = index
+
+    def open(
+        self, num_steps: int, start: int = 0, num_groups: int = 6
+    ) -> None:
+        super().open(num_steps, start, num_groups)
+        self.store = SweepStore(self.path, mode="r+")
+        self.num_groups = num_groups
+        store_groups = self.store.arrays["num_groups"][self.index]
+        if num_steps > self.store.num_steps or num_groups != store_groups:
+            raise ValueError(
+                f"Run of {num_steps} steps and {num_groups} groups does "
+                f"not fit row {self.index} of the sweep store, of "
+                f"{self.store.num_steps} steps and {store_groups} groups"
+            )
+
+    def _write_rows(self, start: int, rows: Dict[str, np.ndarray]) -> None:
+        for name, values in rows.items():
+            array = self.store.arrays[name]
+            # the row of the point, its steps and its groups
+            array[
+                (self.index, slice(start, start + len(values)))
+                + tuple(slice(size) for size in values.shape[1:])
+            ] = values
+            array.flush()
+
+    def read(self, name: str) -> np.ndarray:
+        values = self.store.arrays[name][self.index][: self.num_written]
+        if values.ndim > 1:
+            values = values[:, slice(self.num_groups)]
+        return values
+
+    def close(self, **summary) -> MetricsHandle:
+        self.flush()
+        converged_step = summary.get("converged_step")
+        values = {
+            "max_hits": summary.get("max_hits", -1),
+            "converged_step": -1 if converged_step is None else converged_step,
+            "num_steps": self.num_written,
+        }
+        for name, value in values.items():
+            array = self.store.arrays[name]
+            if array.ndim > 1:
+                array[self.index, slice(self.num_groups)] = value
+            else:
+                array[self.index] = value
+            array.flush()
+        return MetricsHandle(
+            self.backend,
+            self.path,
+            self.num_written,
+            self.names,
+            summary,
+            self.index,
+        )
+
+
+METRICS_SINKS = {
+    sink.backend: sink
+    for sink in [MemoryMetricsSink, NpyMetricsSink, ChunkedMetricsSink]
+}
+
+
+def create_metrics_sink(
+    backend: str, path: Optional[str] = None, flush_every: int = 1000
+) -> MetricsSink:
+    """
+    param backend: "memory", "npy" or "chunked"
+    param path: directory of the npy and chunked backends
+    param flush_every: number of steps buffered between two writes
+    """
+    if backend not in METRICS_SINKS:
+        raise ValueError(f"Unknown metrics backend: {backend}")
+    return METRICS_SINKS[backend](path, flush_every)
+
+
+def chunk_files(path: str, name: str) -> List[Tuple[int, str]]:
+    files = glob.glob(os.path.join(path, f"{name}_" + "[0-9]" * 12 + ".npy"))
+    return sorted(
+        (int(os.path.splitext(file)[0].rsplit("_", 1)[1]), file)
+        for file in files
+    )
+
+
+def read_chunks(path: str, name: str, metric: Tuple[tuple, type]):
+    shape, dtype = metric
+    chunks = [np.load(file) for _, file in chunk_files(path, name)]
+    if not chunks:
+        return np.zeros((0,) + shape, dtype)
+    return np.concatenate(chunks)
+
+
+def open_metrics(path: str) -> MetricsHandle:
+    """
+    Handle of the metrics a persistent sink wrote under path
+    """
+    with open(os.path.join(path, "metrics.json")) as f:
+        info = json.load(f)
+    return MetricsHandle(
+        info["backend"],
+        path,
+        info["num_steps"],
+        info["names"],
+        info["summary"],
+    )
+
+
+def load_metrics(
+    handle: MetricsHandle, name: str, mmap_mode: Optional[str] = "r"
+) -> np.ndarray:
+    """
+    param handle: handle returned by MetricsSink.close or open_metrics
+    param name: metric to load, see METRICS
+    param mmap_mode: memory map the npy backend instead of reading it
+    """
+    if handle.backend == "memory":
+        return handle.series[name]
+    if handle.backend == "npy":
+        values = np.load(
+            os.path.join(handle.path, name + ".npy"), mmap_mode=mmap_mode
+        )
+        return values[: handle.num_steps]
+    if handle.backend == "chunked":
+        return read_chunks(handle.path, name, METRICS[name])
+    if handle.backend == "sweep":
+        return SweepStore(handle.path).read(name, handle.index)
+    raise ValueError(f"Unknown metrics backend: {handle.backend}")
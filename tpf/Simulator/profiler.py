@@ -0,0 +1,149 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# phases of a simulation step, in loop order, each charged once per step;
+# "hit_detection" includes the hit counters and the trajectory recording,
+# "bookkeeping" the metrics, early stopping and checkpoints
+PHASES = [
+    "boundary_expansion",
+    "agent_movement",
+    "hit_detection",
+    "hole_movement",
+    "transition_update",
+    "topology_sampling",
+    "omega_update",
+    "rendering",
+    "bookkeeping",
+]
+
+
+class NullProfiler:
+    """
+    Profiler of a run that is not profiled, every call is a no-op
+    """
+
+    def start(self) -> None:
+        pass
+
+    def lap(self, phase: str) -> None:
+        pass
+
+    def close(self, **meta) -> Optional[dict]:
+        return None
+
+
+class StepProfiler(NullProfiler):
+    """
+    Accumulates the time of every phase of the step loop. The loop calls
+    lap(phase) at the end of each phase, which charges the time since the
+    previous lap to it, measured with perf_counter_ns; the profiler's own
+    work is left out.
+
+    With allocations, every phase also counts the net number of Python
+    memory blocks it allocated (sys.getallocatedblocks) and the bytes and
+    peak traced by tracemalloc, NumPy buffers included. Both walk the
+    allocator and slow the run down noticeably; the times are then only
+    comparable with each other.
+
+    close() returns the report and writes it as JSON to path, if given.
+    """
+
+    def __init__(self, path: Optional[str] = None, allocations=False):
+        self.path = path
+        self.allocations = allocations
+        self.time_ns: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        self.blocks: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+        self.peak_bytes: Dict[str, int] = {}
+
+    def start(self) -> None:
+        self._started_tracing = False
+        if self.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            self._traced = tracemalloc.get_traced_memory()[0]
+            self._blocks = sys.getallocatedblocks()
+        self._start = self._last = time.perf_counter_ns()
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter_ns()
+        self.time_ns[phase] = self.time_ns.get(phase, 0) + now - self._last
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.allocations:
+            self._count_allocations(phase)
+        # leave the profiler's own work out of the phases
+        self._last = time.perf_counter_ns()
+
+    def _count_allocations(self, phase: str) -> None:
+        blocks = sys.getallocatedblocks()
+        traced, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.blocks[phase] = self.blocks.get(phase, 0) + blocks - self._blocks
+        self.bytes[phase] = self.bytes.get(phase, 0) + traced - self._traced
+        self.peak_bytes[phase] = max(
+            self.peak_bytes.get(phase, 0), peak - self._traced
+        )
+        self._blocks, self._traced = blocks, traced
+
+    def report(self, **meta) -> dict:
+        total_ns = sum(self.time_ns.values())
+        phases = {}
+        for phase in sorted(self.time_ns, key=phase_order):
+            phases[phase] = {
+                "calls": self.calls[phase],
+                "time_ns": self.time_ns[phase],
+                "mean_ns": self.time_ns[phase] / self.calls[phase],
+                "share": self.time_ns[phase] / total_ns if total_ns else 0,
+            }
+            if self.allocations:
+                phases[phase]["allocated_blocks"] = self.blocks[phase]
+                phases[phase]["allocated_bytes"] = self.bytes[phase]
+                phases[phase]["peak_bytes"] = self.peak_bytes[phase]
+        return {
+            **meta,
+            "num_steps": max(self.calls.values(), default=0),
+            "total_ns": total_ns,
+            "wall_ns": time.perf_counter_ns() - self._start,
+            "phases": phases,
+        }
+
+    def close(self, **meta) -> dict:
+        """
+        param meta: description of the run stored with the report
+        """
+        report = self.report(**meta)
+        if self._started_tracing:
+            tracemalloc.stop()
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(report, f, indent=2)
+        return report
+
+
+def phase_order(phase: str) -> int:
+    return PHASES.index(phase) if phase in PHASES else len(PHASES)
+
+
+def aggregate_profiles(paths: List[str]) -> pd.DataFrame:
+    """
+    One row per run and phase of the JSON reports at paths, with the run
+    meta data (e.g. num_agents) as columns
+    """
+    rows = []
+    for path in paths:
+        with open(path) as f:
+            report = json.load(f)
+        phases = report.pop("phases")
+        for phase, stats in phases.items():
+            rows.append({**report, "phase": phase, **stats})
+    return pd.DataFrame(rows)
@@ -0,0 +1,154 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Sequence, Tuple
+
+import imageio
+import numpy as np
+from Simulator.trajectory import load_trajectory
+
+# colors of the groups in recording order, as in the simulation plots
+GROUP_COLORS = [
+    (0, 128, 0),
+    (255, 0, 0),
+    (0, 191, 191),
+    (191, 0, 191),
+    (191, 191, 0),
+    (0, 0, 255),
+]
+
+
+def open_animation_writer(path, fps):
+    # frames are appended one by one and encoded as they come
+    if path.lower().endswith(".gif"):
+        return imageio.get_writer(path, duration=1000 / fps, loop=0)
+    return imageio.get_writer(path, fps=fps)
+
+
+def render_frames(
+    path: str,
+    frames: np.ndarray,
+    groups: Sequence[int],
+    resolution: Tuple[int, int],
+) -> np.ndarray:
+    """
+    param path: trajectory directory, see TrajectoryRecorder
+    param frames: indices of the frames to draw
+    param groups: groups to draw, in recording order
+
+    Return (frame, height, width, 3) RGB images: white background, black
+    boundary, red targets and one colored dot per agent
+    """
+    trajectory = load_trajectory(path)
+    meta = trajectory["meta"]
+    render_width, render_height = resolution
+    scale_x = render_width / meta["width"]
+    scale_y = render_height / meta["height"]
+
+    def to_pixels(xy):
+        x = ((xy[..., 0] + meta["width"] / 2) * scale_x).astype(int)
+        y = ((xy[..., 1] + meta["height"] / 2) * scale_y).astype(int)
+        return x, y
+
+    images = np.full((len(frames), render_height, render_width, 3), 255)
+    images = images.astype(np.uint8)
+    rows, cols = np.ogrid[:render_height, :render_width]
+    dot = int(scale_x) // 2
+    for image, frame in zip(images, frames):
+        # boundary outline
+        half_side = (
+            trajectory["boundary_scale"][frame]
+            * meta["initial_boundary_width"]
+            / 2
+        )
+        corners = np.array([[-half_side, -half_side], [half_side, half_side]])
+        (x0, x1), (y0, y1) = to_pixels(corners)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, render_width - 1), min(y1, render_height - 1)
+        image[[y0, y1], slice(x0, x1 + 1)] = 0
+        image[slice(y0, y1 + 1), [x0, x1]] = 0
+
+        # targets
+        for hole_x, hole_y in zip(*to_pixels(trajectory["hole"][frame])):
+            image[
+                (cols - hole_x) ** 2 + (rows - hole_y) ** 2
+                <= max(1, meta["radius"] * scale_x) ** 2
+            ] = (255, 0, 0)
+
+        # agents
+        for group in groups:
+            x, y = to_pixels(trajectory["positions"][frame, group])
+            for dx in range(-dot, dot + 1):
+                for dy in range(-dot, dot + 1):
+                    inside = (
+                        (0 <= x + dx)
+                        & (x + dx < render_width)
+                        & (0 <= y + dy)
+                        & (y + dy < render_height)
+                    )
+                    image[y[inside] + dy, x[inside] + dx] = GROUP_COLORS[
+                        group % len(GROUP_COLORS)
+                    ]
+    return images
+
+
+def replay(
+    path: str,
+    animation_path: str,
+    groups: Optional[Sequence[int]] = None,
+    steps: Optional[Tuple[int, int]] = None,
+    resolution: Optional[Tuple[int, int]] = None,
+    fps: int = 20,
+    max_workers: Optional[int] = None,
+    frames_per_task: int = 50,
+) -> str:
+    """
+    param path: trajectory directory recorded by run_simulation
+    param animation_path: .gif or .mp4 the frames are streamed to
+    param groups: groups to draw (recording order: mesh groups, star,
+    ring, static), all if None
+    param steps: [first, last) steps to draw, all recorded steps if None
+    param resolution: (width, height) of the frames, the environment size
+    if None
+    param max_workers: number of rendering processes, os.cpu_count() if
+    None
+
+    Frames are rendered in parallel in blocks of frames_per_task and
+    written in order; at most two blocks per worker are held in memory.
+    """
+    trajectory = load_trajectory(path)
+    meta = trajectory["meta"]
+    if groups is None:
+        groups = range(meta["num_groups"])
+    if resolution is None:
+        resolution = (meta["width"], meta["height"])
+    frames = np.arange(meta["num_frames"])
+    if steps is not None:
+        recorded = trajectory["step"]
+        frames = frames[(recorded >= steps[0]) & (recorded < steps[1])]
+    blocks = [
+        frames[slice(start, start + frames_per_task)]
+        for start in range(0, len(frames), frames_per_task)
+    ]
+
+    max_workers = max_workers or os.cpu_count()
+    max_pending = 2 * max_workers
+    writer = open_animation_writer(animation_path, fps)
+    with ProcessPoolExecutor(max_workers) as executor:
+        pending = deque()
+        for block in blocks:
+            pending.append(
+                executor.submit(
+                    render_frames, path, block, list(groups), resolution
+                )
+            )
+            if len(pending) >= max_pending:
+                for image in pending.popleft().result():
+                    writer.append_data(image)
+        while pending:
+            for image in pending.popleft().result():
+                writer.append_data(image)
+    writer.close()
+    logging.info(f"Replay of {len(frames)} frames saved at {animation_path}")
+    return animation_path
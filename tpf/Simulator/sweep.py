@@ -0,0 +1,278 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, replace
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from interface import SweepPoint
+from Simulator.convergence import EarlyStopping
+from Simulator.game import count_groups, run_simulation
+from Simulator.metrics import (
+    SweepMetricsSink,
+    SweepStore,
+    create_metrics_sink,
+)
+from Simulator.profiler import StepProfiler
+
+# per-step cost of run_simulation relative to its fixed overhead, fitted
+# on timings of 10 to 320 agents: 1 + num_agents / a + (num_agents / b)^2
+ENGINE_COSTS = {
+    "object": (15, 55),
+    "vector": (float("inf"), 60),
+}
+
+
+def point_key(params: Dict[str, Any]) -> str:
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def spawn_seed(seed: int, key: str) -> int:
+    # seed of the child stream of SeedSequence(seed) spawned for the point
+    # key, the same whatever the order of the grid
+    child = np.random.SeedSequence(seed, spawn_key=(int(key, 16),))
+    return int(child.generate_state(1, np.uint64)[0])
+
+
+def estimate_cost(params: Dict[str, Any]) -> float:
+    """
+    Relative run time of run_simulation with params, used to order jobs
+    """
+    linear, quadratic = ENGINE_COSTS[params.get("engine", "object")]
+    num_agents = params["num_agents"]
+    return params["num_steps"] * (
+        1 + num_agents / linear + (num_agents / quadratic) ** 2
+    )
+
+
+def expand_grid(
+    base_params: Dict[str, Any],
+    grid: Dict[str, List[Any]],
+    cost: Callable[[Dict[str, Any]], float] = estimate_cost,
+) -> List[SweepPoint]:
+    """
+    param base_params: keyword arguments shared by every point
+    param grid: values of every swept argument; one point per combination
+
+    Return the points in grid order. Every point with a seed in its params
+    runs on its own child stream of it, spawn_seed(seed, key), so points
+    that share a seed still draw independent numbers
+    """
+    points = []
+    for index, values in enumerate(product(*grid.values())):
+        params = {**base_params, **dict(zip(grid, values))}
+        key = point_key(params)
+        seed = params.get("seed")
+        points.append(
+            SweepPoint(
+                key,
+                params,
+                cost(params),
+                index,
+                None if seed is None else spawn_seed(seed, key),
+            )
+        )
+    return points
+
+
+def create_sweep_store(path: str, points: List[SweepPoint]) -> SweepStore:
+    """
+    Preallocates the SweepStore the "sweep" metrics backend of
+    simulate_point writes to, one row per point
+    """
+    return SweepStore.create(
+        path,
+        [point.key for point in points],
+        max(point.params["num_steps"] for point in points),
+        [
+            count_groups(
+                **{
+                    name: point.params[name]
+                    for name in ["link_percentage_list", "topologies"]
+                    if name in point.params
+                }
+            )
+            for point in points
+        ],
+    )
+
+
+def simulate_point(
+    point: SweepPoint,
+    metrics_backend: str = "npy",
+    metrics_dir: str = "stats/metrics/",
+    metrics_flush_every: int = 1000,
+    profile_dir: Optional[str] = None,
+    profile_allocations: bool = False,
+) -> Dict[str, Any]:
+    """
+    Sweep worker: runs run_simulation with the params of point and streams
+    its metrics to metrics_dir/<point key>, or with the "sweep" backend to
+    row point.index of the SweepStore at metrics_dir (create_sweep_store).
+    The convergence plot and task matrix of the run are named after the
+    num_agents and key of the point. With profile_dir, the run is profiled
+    and its StepProfiler report written to profile_dir/<point key>.json;
+    profile_allocations also counts the allocations of every phase.
+    Returns {"handle": the fields of the MetricsHandle, small enough to
+    go into the results table, "profile": the path of the profile or None}
+    """
+    if metrics_backend == "sweep":
+        metrics_sink = SweepMetricsSink(
+            metrics_dir, point.index, metrics_flush_every
+        )
+    else:
+        metrics_sink = create_metrics_sink(
+            metrics_backend,
+            os.path.join(metrics_dir, point.key),
+            metrics_flush_every,
+        )
+    params = dict(point.params)
+    if point.seed is not None:
+        params["seed"] = point.seed
+    # points that share num_agents must not overwrite each other's files
+    params.setdefault("run_name", f"{params['num_agents']}_{point.key}")
+    if params.get("early_stopping") is not None:
+        params["early_stopping"] = EarlyStopping(**params["early_stopping"])
+    profile_path = None
+    if profile_dir is not None:
+        profile_path = os.path.join(profile_dir, point.key + ".json")
+        params["profiler"] = StepProfiler(profile_path, profile_allocations)
+    handle = run_simulation(metrics_sink=metrics_sink, **params)
+    return {
+        "handle": {
+            "backend": handle.backend,
+            "path": handle.path,
+            "num_steps": handle.num_steps,
+            "names": handle.names,
+            "summary": handle.summary,
+            "index": handle.index,
+        },
+        "profile": profile_path,
+    }
+
+
+def run_timed(worker: Callable, point: SweepPoint):
+    start = time.perf_counter()
+    result = worker(point)
+    return result, time.perf_counter() - start
+
+
+class ResultsTable:
+    """
+    Results of a sweep as JSON lines, one record per finished point,
+    appended and synced as soon as the point finishes. Readable with
+    pandas.read_json(path, lines=True).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a line cut short by an interrupted sweep
+                    continue
+        return records
+
+    def done(self) -> Dict[str, Dict[str, Any]]:
+        # the last successful record of every point
+        return {
+            record["key"]: record
+            for record in self.read()
+            if record["status"] == "done"
+        }
+
+    def append(self, record: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_sweep(
+    points: List[SweepPoint],
+    results_path: str,
+    worker: Callable[[SweepPoint], Any] = simulate_point,
+    max_workers: Optional[int] = None,
+    max_retries: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    param points: sweep points, see expand_grid
+    param results_path: JSON lines results table; points already done in
+    it are skipped, so an interrupted sweep resumes where it stopped
+    param worker: picklable function run on every point, its return
+    value is stored as the record's "result"
+    param max_workers: number of worker processes, os.cpu_count() if None
+    param max_retries: number of times a failed point is run again
+
+    Jobs are submitted longest first (by point cost), so the long runs do
+    not leave the pool idle at the end of the sweep. Failed points are
+    retried in a fresh pool, which also recovers from a worker that died.
+    The seed of every point is stored with its record, a point already in
+    the table is run again with the seed it was recorded with.
+
+    Return the records of all points, in the order of points
+    """
+    table = ResultsTable(results_path)
+    done = table.done()
+    seeds = {record["key"]: record.get("seed") for record in table.read()}
+    pending = [
+        (
+            point
+            if seeds.get(point.key) is None
+            else replace(point, seed=seeds[point.key])
+        )
+        for point in points
+        if point.key not in done
+    ]
+    logging.info(
+        f"Sweep of {len(points)} points, {len(points) - len(pending)} "
+        f"already in {results_path}"
+    )
+    attempts = {point.key: 0 for point in pending}
+    records = dict(done)
+
+    while pending:
+        pending.sort(key=lambda point: point.cost, reverse=True)
+        failed = []
+        with ProcessPoolExecutor(max_workers) as executor:
+            futures = {
+                executor.submit(run_timed, worker, point): point
+                for point in pending
+            }
+            for future in as_completed(futures):
+                point = futures[future]
+                attempts[point.key] += 1
+                record = {**asdict(point), "attempts": attempts[point.key]}
+                try:
+                    result, seconds = future.result()
+                    record.update(
+                        status="done", result=result, seconds=seconds
+                    )
+                except Exception as exc:
+                    if attempts[point.key] <= max_retries:
+                        logging.warning(
+                            f"Sweep point {point.key} failed ({exc}), "
+                            f"retry {attempts[point.key]}/{max_retries}"
+                        )
+                        failed.append(point)
+                        continue
+                    logging.error(f"Sweep point {point.key} failed: {exc}")
+                    record.update(status="failed", error=repr(exc))
+                table.append(record)
+                records[point.key] = record
+        pending = failed
+
+    return [records[point.key] for point in points if point.key in records]
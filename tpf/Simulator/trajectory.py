@@ -0,0 +1,148 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+TRAJECTORY_ARRAYS = ["step", "positions", "hole", "boundary_scale"]
+
+
+class TrajectoryRecorder:
+    """
+    Records the trajectories of a run as float32 arrays in preallocated
+    .npy files under path, one frame every record_every steps:
+
+        step (frame,)                      step of the frame
+        positions (frame, group, agent, 2) agent positions, in agent order
+                                           (dynamic groups, static last)
+        hole (frame, target, 2)            target positions, the hole
+                                           first
+        boundary_scale (frame,)            boundary side over its initial
+                                           side
+
+    Frames are buffered and written every flush_every frames; meta.json
+    describes the run, see load_trajectory.
+    """
+
+    def __init__(
+        self, path: str, record_every: int = 1, flush_every: int = 100
+    ):
+        self.path = path
+        self.record_every = record_every
+        self.flush_every = flush_every
+        self.num_frames = 0
+        self._buffer: List[tuple] = []
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name + ".npy")
+
+    def open(
+        self,
+        num_steps: int,
+        num_groups: int,
+        num_agents: int,
+        meta: dict,
+        start: int = 0,
+        num_targets: int = 1,
+    ) -> None:
+        """
+        param meta: description of the run stored in meta.json (width,
+        height, radius, initial_boundary_width, group labels)
+        param start: first step to record; frames before it are kept from
+        an interrupted run of the same recorder (see checkpoint)
+        """
+        capacity = -(-num_steps // self.record_every)
+        shapes = {
+            "step": ((capacity,), np.int64),
+            "positions": ((capacity, num_groups, num_agents, 2), np.float32),
+            "hole": ((capacity, num_targets, 2), np.float32),
+            "boundary_scale": ((capacity,), np.float32),
+        }
+        os.makedirs(self.path, exist_ok=True)
+        self._buffer = []
+        self.num_frames = -(-start // self.record_every)
+        if start > 0:
+            self.arrays = {
+                name: np.load(self._file(name), mmap_mode="r+")
+                for name in TRAJECTORY_ARRAYS
+            }
+        else:
+            self.arrays = {
+                name: np.lib.format.open_memmap(
+                    self._file(name), mode="w+", dtype=dtype, shape=shape
+                )
+                for name, (shape, dtype) in shapes.items()
+            }
+        self.meta = {
+            **meta,
+            "num_steps": num_steps,
+            "num_groups": num_groups,
+            "num_agents": num_agents,
+            "num_targets": num_targets,
+            "record_every": self.record_every,
+        }
+
+    def record(
+        self,
+        step: int,
+        positions: np.ndarray,
+        targets: np.ndarray,
+        boundary_scale: float,
+    ) -> None:
+        """
+        param positions: (group * agent, 2) positions in agent order
+        param targets: target positions, stored as (target, 2) even for a
+        single target
+        """
+        if step % self.record_every != 0:
+            return
+        self._buffer.append(
+            (
+                step,
+                np.array(positions, np.float32),
+                np.array(targets, np.float32).reshape(-1, 2),
+                boundary_scale,
+            )
+        )
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        steps, positions, targets, scales = zip(*self._buffer)
+        frames = slice(self.num_frames, self.num_frames + len(steps))
+        shape = self.arrays["positions"].shape[1:]
+        self.arrays["step"][frames] = steps
+        self.arrays["positions"][frames] = np.reshape(
+            positions, (len(steps),) + shape
+        )
+        self.arrays["hole"][frames] = targets
+        self.arrays["boundary_scale"][frames] = scales
+        for array in self.arrays.values():
+            array.flush()
+        self.num_frames += len(steps)
+        self._buffer = []
+
+    def close(self) -> str:
+        self.flush()
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({**self.meta, "num_frames": self.num_frames}, f)
+        return self.path
+
+
+def load_trajectory(path: str, mmap_mode: Optional[str] = "r") -> dict:
+    """
+    Memory-mapped arrays of a recorded trajectory, trimmed to the frames
+    written, and its meta data under "meta"
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    trajectory = {
+        name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)[
+            : meta["num_frames"]
+        ]
+        for name in TRAJECTORY_ARRAYS
+    }
+    trajectory["meta"] = meta
+    return trajectory
@@ -0,0 +1,81 @@
+import logging
+import os
+import sys
+
+from Simulator.benchmark import (
+    compare_results,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+seed = 2024
+repeats = 5
+# sizes of the benchmarks of Simulator.benchmark.BENCHMARKS
+agent_counts = [10, 30, 100, 300, 1000, 3000, 5000]
+sizes = {
+    "agent_move": agent_counts,
+    "update_omega_matrix": agent_counts,
+    "FJ_update_parameters": agent_counts,
+    "calculate_hits": agent_counts,
+    "update_state_transition_matrix": [10, 100, 1000, 10000],
+}
+# run_simulation is swept over one argument at a time, the others fixed
+simulation_params = {
+    "width": 80,
+    "height": 60,
+    "radius": 2,
+    "initial_boundary_width": 10,
+    "velocity": 1,
+    "dt": 1,
+    "num_agents": 30,
+    "num_steps": 100,
+    "expansion_times": 5,
+    "engine": "vector",
+}
+simulation_sizes = {
+    "num_agents": [10, 30, 100, 300, 1000],
+    "num_steps": [50, 100, 200, 400],
+}
+
+results_path = "stats/benchmark/results.json"
+# results of a reference commit; created by the first run, replaced when
+# update_baseline is set
+baseline_path = "stats/benchmark/baseline.json"
+update_baseline = False
+time_tolerance = 0.3  # allowed slowdown at any size
+exponent_tolerance = 0.15  # allowed increase of a scaling exponent
+
+
+def main():
+    results = run_benchmarks(
+        sizes, simulation_sizes, simulation_params, seed, repeats
+    )
+    save_results(results, results_path)
+    for name, result in results["benchmarks"].items():
+        logging.info(
+            f"{name} scales as {result['parameter']}^{result['exponent']:.2f}"
+        )
+    logging.info(f"Benchmark results saved at {results_path}")
+
+    if update_baseline or not os.path.exists(baseline_path):
+        save_results(results, baseline_path)
+        logging.info(f"Benchmark baseline saved at {baseline_path}")
+        return 0
+    regressions = compare_results(
+        results,
+        load_results(baseline_path),
+        time_tolerance,
+        exponent_tolerance,
+    )
+    for regression in regressions:
+        logging.error(f"Regression: {regression}")
+    if not regressions:
+        logging.info(f"No regression against {baseline_path}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
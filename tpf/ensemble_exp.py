@@ -0,0 +1,60 @@
+import logging
+
+from Plotter.simulation_plotter import plot_hits, plot_max_hits
+from Simulator.ensemble import run_ensemble_simulation
+
+logging.basicConfig(level=logging.INFO)
+
+params = {
+    "width": 80,
+    "height": 60,
+    "radius": 2,
+    "initial_boundary_width": 10,
+    "velocity": 1,
+    "dt": 1,
+    "num_steps": 2000,
+    "expansion_times": 5,
+    "seed": 2024,
+}
+
+num_agents_list = [10, 20, 30, 50, 80]
+# independent replicas of every agent count, run in lockstep
+num_replicas = 32
+quantiles = (0.05, 0.5, 0.95)
+
+
+def main():
+    mean_max_hits_list = []
+
+    for num_agents in num_agents_list:
+        result = run_ensemble_simulation(
+            num_agents=num_agents,
+            num_replicas=num_replicas,
+            quantiles=quantiles,
+            **params,
+        )
+        mean_max_hits_list.append(tuple(result.mean_max_hits))
+        logging.info(
+            f"Max hits of {num_agents} agents over {num_replicas} "
+            f"replicas: mean {result.mean_max_hits.round(2).tolist()}, "
+            f"std {result.std_max_hits.round(2).tolist()}"
+        )
+
+        plot_hits(
+            params["num_steps"],
+            *result.mean_cumulative_hits,
+            save_path=(
+                f"plots/simulation_plots/"
+                f"ensemble_cumulative_hits_over_time_{num_agents}.png"
+            ),
+        )
+
+    plot_max_hits(
+        num_agents_list,
+        mean_max_hits_list,
+        save_path="plots/simulation_plots/ensemble_max_hits.png",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 import networkx as nx
+import numpy as np
 from shapely.geometry import Point, Polygon
 
 
@@ -14,6 +15,18 @@ class GraphData:
     name: str
 
 
+@dataclass
+class EdgeListGraph:
+    # GraphData in the compact form sent to worker processes: edge k is
+    # nodes[edges[k, 0]] -> nodes[edges[k, 1]]
+    id: UUID
+    type: str
+    name: str
+    nodes: List[Any]  # in graph order
+    edges: np.ndarray  # (m, 2) node indices, in graph order, smallest dtype
+    weights: Optional[np.ndarray] = None  # (m,) edge "weight" attributes
+
+
 @dataclass
 class GraphFeatures:
     id: UUID
@@ -34,6 +47,14 @@ class GraphFeatures:
     average_second_order_centrality: float = 0
     average_clustering_coefficient: float = 0
     # add more features here (if any)
+    # how betweenness, edge betweenness and the path length based features
+    # were computed: "exact", or "approximate" from num_samples pivots
+    # drawn with seed; error_bounds then holds the error bound of every
+    # approximated feature (and its average) by name
+    mode: str = "exact"
+    num_samples: Optional[int] = None
+    seed: Optional[int] = None
+    error_bounds: Dict[str, float] = field(default_factory=dict)
 
 
 @dataclass
@@ -75,6 +96,74 @@ class ContiAgent:
     boundary: Polygon
 
 
+@dataclass
+class ContiAgentArray:
+    # structure-of-arrays counterpart of ContiAgent, row i is agent i
+    id: np.ndarray
+    group: np.ndarray
+    position: np.ndarray  # shape (n, 2)
+    direction: np.ndarray
+    speed: np.ndarray
+    boundary: Polygon
+
+
+@dataclass
+class SparseAdjacency:
+    # unweighted adjacency matrix as a COO edge list, edge k is
+    # rows[k] -> cols[k]
+    num_nodes: int
+    rows: np.ndarray
+    cols: np.ndarray
+
+
+@dataclass
+class EnsembleResult:
+    # groups are in run_simulation order, the static group first
+    quantiles: np.ndarray  # (q,)
+    cumulative_hits: np.ndarray  # (replica, group, step)
+    max_hits: np.ndarray  # (replica, group)
+    changes_per_step: np.ndarray  # (replica, step)
+    mean_cumulative_hits: np.ndarray  # (group, step)
+    std_cumulative_hits: np.ndarray  # (group, step)
+    quantile_cumulative_hits: np.ndarray  # (q, group, step)
+    mean_max_hits: np.ndarray  # (group,)
+    std_max_hits: np.ndarray  # (group,)
+    quantile_max_hits: np.ndarray  # (q, group)
+
+
+@dataclass
+class MetricsHandle:
+    # what a run returns when its time series go to a metrics sink; the
+    # series are loaded with Simulator.metrics.load_metrics
+    backend: str  # "memory", "npy", "chunked" or "sweep"
+    path: Optional[str]
+    num_steps: int  # number of steps written
+    names: List[str]
+    summary: Dict[str, Any] = field(default_factory=dict)
+    index: Optional[int] = None  # row of the sweep backend
+    # only the memory backend carries the series themselves
+    series: Dict[str, np.ndarray] = field(default_factory=dict)
+
+
+@dataclass
+class SweepPoint:
+    # one configuration of a parameter sweep
+    key: str  # content hash of params, identifies the point across runs
+    params: Dict[str, Any]
+    cost: float = 0  # estimated relative run time
+    index: int = 0  # position in the sweep, row of its SweepStore
+    seed: Optional[int] = None  # seed of its run, see sweep.spawn_seed
+
+
+@dataclass
+class Target:
+    # a hole of the environment, all targets share Env.radius
+    id: int
+    x: float
+    y: float
+    direction: float
+
+
 @dataclass
 class AgentData:
     id: int
@@ -13,51 +13,76 @@ storage_paths = {
     "topo_plot_path": "plots/mas/",
     "task_plot_path": "plots/task/",
 }
+# processes of the feature extraction
+max_workers = None  # os.cpu_count()
+# "approximate" estimates the path based MAS features from num_samples
+# pivots, for topologies too large for the exact features
+mas_feature_mode = "exact"
+num_samples = 100
+feature_seed = 2024
 
-# step 1 generate graphs / or extract graphs (to be added)
-mas_gen = GraphGen(storage_paths["topo_path"], "mas")
-task_gen = GraphGen(storage_paths["topo_path"], "task")
-df_mas_graph = mas_gen.gen_and_save_graph(
-    mas_topologies, n_nodes_in_topologies, n_topologies
-)
-df_task_graph = task_gen.gen_and_save_graph(
-    task_topologies, n_nodes_in_topologies, n_topologies
-)
-
-# step 2 analysing graph features
-mas_feat_analyse = FeatureAnalyse(df_mas_graph, storage_paths["topo_fea_path"])
-task_feat_analyse = FeatureAnalyse(
-    df_task_graph, storage_paths["topo_fea_path"]
-)
-df_mas_features = mas_feat_analyse.mas_feature()
-df_task_features = task_feat_analyse.task_feature()
-
-# step 3 calculating matching result
-mas_feat_eval = FeatureEval(df_mas_features, storage_paths["topo_fea_path"])
-df_mas_eval = mas_feat_eval.mas_eval()
-task_feat_eval = FeatureEval(df_task_features, storage_paths["topo_fea_path"])
-df_task_eval = task_feat_eval.task_eval()
-
-
-# step 4 matching and optimizing
-
-
-# along with step 1-4, do plotting and visualization
-mas_plottor = PlotGen(
-    df_mas_graph, df_mas_features, df_mas_eval, storage_paths["topo_plot_path"]
-)
-task_plottor = PlotGen(
-    df_task_graph,
-    df_task_features,
-    df_task_eval,
-    storage_paths["task_plot_path"],
-)
-# 1. plotting the graph
-mas_plottor.plot_topo()
-task_plottor.plot_topo()
-# 2. plotting the graph features
-mas_plottor.plot_feature()
-task_plottor.plot_feature()
-# 3. plotting the evaluation results
-mas_plottor.plot_eval()
-task_plottor.plot_eval()
+
+def main():
+    # step 1 generate graphs / or extract graphs (to be added)
+    mas_gen = GraphGen(storage_paths["topo_path"], "mas")
+    task_gen = GraphGen(storage_paths["topo_path"], "task")
+    df_mas_graph = mas_gen.gen_and_save_graph(
+        mas_topologies, n_nodes_in_topologies, n_topologies
+    )
+    df_task_graph = task_gen.gen_and_save_graph(
+        task_topologies, n_nodes_in_topologies, n_topologies
+    )
+
+    # step 2 analysing graph features
+    mas_feat_analyse = FeatureAnalyse(
+        df_mas_graph, storage_paths["topo_fea_path"]
+    )
+    task_feat_analyse = FeatureAnalyse(
+        df_task_graph, storage_paths["topo_fea_path"]
+    )
+    df_mas_features = mas_feat_analyse.mas_feature(
+        max_workers,
+        mode=mas_feature_mode,
+        num_samples=num_samples,
+        seed=feature_seed,
+    )
+    df_task_features = task_feat_analyse.task_feature(max_workers)
+
+    # step 3 calculating matching result
+    mas_feat_eval = FeatureEval(
+        df_mas_features, storage_paths["topo_fea_path"]
+    )
+    df_mas_eval = mas_feat_eval.mas_eval()
+    task_feat_eval = FeatureEval(
+        df_task_features, storage_paths["topo_fea_path"]
+    )
+    df_task_eval = task_feat_eval.task_eval()
+
+    # step 4 matching and optimizing
+
+    # along with step 1-4, do plotting and visualization
+    mas_plottor = PlotGen(
+        df_mas_graph,
+        df_mas_features,
+        df_mas_eval,
+        storage_paths["topo_plot_path"],
+    )
+    task_plottor = PlotGen(
+        df_task_graph,
+        df_task_features,
+        df_task_eval,
+        storage_paths["task_plot_path"],
+    )
+    # 1. plotting the graph
+    mas_plottor.plot_topo()
+    task_plottor.plot_topo()
+    # 2. plotting the graph features
+    mas_plottor.plot_feature()
+    task_plottor.plot_feature()
+    # 3. plotting the evaluation results
+    mas_plottor.plot_eval()
+    task_plottor.plot_eval()
+
+
+if __name__ == "__main__":
+    main()
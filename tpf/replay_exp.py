@@ -0,0 +1,48 @@
+import logging
+
+from Simulator.game import run_simulation
+from Simulator.replay import replay
+from Simulator.trajectory import TrajectoryRecorder
+
+logging.basicConfig(level=logging.INFO)
+
+params = {
+    "width": 80,
+    "height": 60,
+    "radius": 2,
+    "initial_boundary_width": 10,
+    "velocity": 1,
+    "num_agents": 50,
+    "dt": 1,
+    "num_steps": 2000,
+    "expansion_times": 3,
+    "engine": "vector",
+    "seed": 2024,
+}
+
+trajectory_path = "stats/trajectory/simulation_50/"
+# one animation per entry: groups (recording order: mesh 10%, 50%, 90%,
+# star, chain, static), [first, last) steps or None for all, file name
+replays = [
+    ([2, 5], None, "plots/animation/replay_50.gif"),
+    (None, (0, 200), "plots/animation/replay_50_start.gif"),
+]
+
+
+def main():
+    # one headless run, recorded every step, serves all replays
+    run_simulation(
+        trajectory_recorder=TrajectoryRecorder(trajectory_path), **params
+    )
+    for groups, steps, animation_path in replays:
+        replay(
+            trajectory_path,
+            animation_path,
+            groups=groups,
+            steps=steps,
+            resolution=(320, 240),
+        )
+
+
+if __name__ == "__main__":
+    main()
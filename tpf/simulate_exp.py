@@ -1,8 +1,17 @@
 import logging
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
+from functools import partial
 
+from interface import MetricsHandle
 from Plotter.simulation_plotter import plot_hits, plot_max_hits
-from Simulator.game import run_simulation
+from Simulator.metrics import load_metrics
+from Simulator.profiler import aggregate_profiles
+from Simulator.sweep import (
+    create_sweep_store,
+    expand_grid,
+    run_sweep,
+    simulate_point,
+)
 
 logging.basicConfig(level=logging.INFO)
 
@@ -15,57 +24,127 @@ params = {
     "dt": 1,
     "num_steps": 2000,
     "expansion_times": 5,
+    "engine": "object",  # "object" or "vector"
 }
 
 num_agents_list = [10, 20, 30, 50, 80]
 # [200, 300]
 # [10, 20, 30, 50, 80, 100]
+base_seed = 2024
+# swept arguments of run_simulation, one run per combination, e.g.
+# "radius": [1, 2, 4], "expansion_times": [3, 5],
+# "link_percentage_list": [[0.1, 0.5, 0.9], [0.1, 0.3, 0.5, 0.7, 0.9]],
+# "seed": [2024, 2025, 2026]; every point runs on its own child stream of
+# its seed, recorded in the results table
+grid = {
+    "num_agents": num_agents_list,
+    "seed": [base_seed],
+}
+# stop the dynamics once changes_per_step has settled, None runs all steps;
+# e.g. dict(threshold=0.05, window=50, patience=20, mode="frozen")
+params["early_stopping"] = None
+
+# finished points go to the results table as they complete; rerunning the
+# sweep skips them
+results_path = "stats/sweep/simulation.jsonl"
+max_workers = None  # os.cpu_count()
+max_retries = 2
+# workers stream their time series and only send back a MetricsHandle;
+# "sweep" writes every point into its row of one preallocated memory map
+# under metrics_dir, read in place here, "npy" or "chunked" write to
+# metrics_dir/<point key>
+metrics_backend = "sweep"
+metrics_dir = "stats/sweep/simulation_store/"
+metrics_flush_every = 1000
+# time every phase of the step loop of every point and write one report
+# per point there, None runs without profiling; the reports are collected
+# into profile_path
+profile_dir = None  # "stats/sweep/profiles/"
+profile_path = "stats/sweep/profile.csv"
+# also count the allocations of every phase, slows the runs down
+profile_allocations = False
 
 
-def run_simulation_for_agents(num_agents, **params):
-    return run_simulation(num_agents=num_agents, **params)
+def point_label(point_params, swept):
+    # swept values other than num_agents, for file names
+    return "".join(
+        f"_{name}_{point_params[name]}"
+        for name in swept
+        if name != "num_agents"
+    )
 
 
 def main():
-    agent_counts_list = []
-    max_hits_list = []
+    points = expand_grid(params, grid)
+    if metrics_backend == "sweep":
+        create_sweep_store(metrics_dir, points)
+    worker = partial(
+        simulate_point,
+        metrics_backend=metrics_backend,
+        metrics_dir=metrics_dir,
+        metrics_flush_every=metrics_flush_every,
+        profile_dir=profile_dir,
+        profile_allocations=profile_allocations,
+    )
+    records = run_sweep(points, results_path, worker, max_workers, max_retries)
 
-    with ProcessPoolExecutor() as executor:
-        futures = {
-            executor.submit(
-                run_simulation_for_agents, num_agents, **params
-            ): num_agents
-            for num_agents in num_agents_list
-        }
+    swept = [name for name, values in grid.items() if len(values) > 1]
+    agent_counts = defaultdict(list)
+    max_hits_lists = defaultdict(list)
+    group_labels = {}
+    for record in records:
+        point_params = record["params"]
+        num_agents = point_params["num_agents"]
+        if record["status"] != "done":
+            logging.error(
+                f"Simulation for {num_agents} agents failed: "
+                f"{record['error']}"
+            )
+            continue
+        handle = MetricsHandle(**record["result"]["handle"])
+        label = point_label(point_params, swept)
+        if handle.summary["converged_step"] is not None:
+            logging.info(
+                f"Simulation for {num_agents} agents{label} converged "
+                f"after {handle.summary['converged_step']} steps"
+            )
+        agent_counts[label].append(num_agents)
+        max_hits_lists[label].append(tuple(handle.summary["max_hits"]))
+        group_labels[label] = handle.summary.get("group_labels")
 
-        for future in as_completed(futures):
-            num_agents = futures[future]
-            try:
-                result = future.result()
-                cumulative_hits_over_time = result[slice(0, len(result) // 2)]
-                max_hits = result[slice(len(result) // 2, len(result))]
-                agent_counts_list.append(num_agents)
-                max_hits_list.append(max_hits)
+        plot_hits(
+            point_params["num_steps"],
+            *load_metrics(handle, "cumulative_hits").T,
+            save_path=(
+                f"plots/simulation_plots/"
+                f"cumulative_hits_over_time_{num_agents}{label}.png"
+            ),
+            labels=group_labels[label],
+        )
 
-                plot_hits(
-                    params["num_steps"],
-                    *cumulative_hits_over_time,
-                    save_path=(
-                        f"plots/simulation_plots/"
-                        f"cumulative_hits_over_time_{num_agents}.png"
-                    ),
-                )
-            except Exception as exc:
-                logging.error(
-                    f"Simulation for {num_agents} agents"
-                    f"generated an exception: {exc}"
-                )
+    for label, agent_counts_list in agent_counts.items():
+        plot_max_hits(
+            agent_counts_list,
+            max_hits_lists[label],
+            save_path=f"plots/simulation_plots/max_hits{label}.png",
+            labels=group_labels[label],
+        )
 
-    plot_max_hits(
-        agent_counts_list,
-        max_hits_list,
-        save_path="plots/simulation_plots/max_hits.png",
-    )
+    profiles = [
+        record["result"]["profile"]
+        for record in records
+        if record["status"] == "done" and record["result"].get("profile")
+    ]
+    if profiles:
+        profile = aggregate_profiles(profiles)
+        profile.to_csv(profile_path, index=False)
+        shares = profile.pivot_table(
+            index="phase", columns="num_agents", values="share"
+        )
+        logging.info(f"Share of the step time per phase:\n{shares}")
+        logging.info(
+            f"Profiles of {len(profiles)} runs saved at {profile_path}"
+        )
 
 
 if __name__ == "__main__":
@@ -1,10 +1,13 @@
 import csv
 import os
 import pickle
+from typing import Optional, Tuple
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
+from Env_simulator.spatial_hash import SpatialHashGrid
 
 # def calculate_hits(needles, target_hole):
 #     return [needle for needle in needles if target_hole.contains(needle)]
@@ -18,6 +21,58 @@ def calculate_hits(agents, target_hole):
     return hits_agents
 
 
+def calculate_hits_in_circle(
+    positions: np.ndarray,
+    center,
+    radius: float,
+    group: Optional[np.ndarray] = None,
+    num_groups: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    param positions: (n, 2) array of agent coordinates
+    param center: (x, y) of the hole
+    param radius: radius of the hole
+    param group: group id of every agent, all agents are in group 0 if None
+    param num_groups: number of groups
+
+    Analytic counterpart of calculate_hits for a circular hole, returns
+    the hit mask of the agents and the number of hits in every group
+    """
+    offset = positions - np.asarray(center, dtype=float)
+    hit_mask = np.einsum("ij,ij->i", offset, offset) < radius**2
+    if group is None:
+        group = np.zeros(len(positions), dtype=int)
+    hit_counts = np.bincount(group[hit_mask], minlength=num_groups)
+    return hit_mask, hit_counts
+
+
+def calculate_target_hits(
+    positions: np.ndarray,
+    centers: np.ndarray,
+    radius: float,
+    grid: Optional[SpatialHashGrid] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    param positions: (n, 2) array of agent coordinates
+    param centers: (t, 2) array of target coordinates
+    param radius: radius of the targets
+    param grid: spatial index rebuilt from positions; every agent is
+    tested against every target if None
+
+    Return (target ids, agent ids) of every agent inside every target
+    """
+    if grid is not None:
+        grid.build(positions)
+        return grid.query_circles(centers, radius)
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    hits = [
+        calculate_hits_in_circle(positions, center, radius)[0]
+        for center in centers
+    ]
+    hits = np.reshape(hits, (len(centers), len(positions)))
+    return np.nonzero(hits)
+
+
 def save_file(file: pd.DataFrame, filename):
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     file.to_pickle(filename)
@@ -16,6 +16,9 @@ params = {
     "num_steps": 2000,
     "FPS": 20,
     "expansion_times": 3,
+    "headless": True,  # offscreen, not held to the frame rate
+    "render_every": 1,  # save every k-th step
+    "resolution": None,  # (width, height) of the frames
 }
 
 